@@ -0,0 +1,101 @@
+"""
+Benchmark de memória da exportação para Excel
+
+Compara o pico de memória (RSS) da exportação atual, que monta um DataFrame e o
+grava com pandas/openpyxl, com a exportação em modo streaming, para diferentes
+quantidades de linhas. Cada medição roda em um processo separado para que o
+pico de uma não contamine a outra.
+
+Uso:
+    python benchmark_exportacao.py [quantidade_linhas ...]
+"""
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+QUANTIDADES_PADRAO = [10_000, 50_000, 100_000, 250_000]
+MODOS = ("pandas", "streaming")
+
+
+def gerar_linhas(quantidade, colunas):
+    """
+    Gera linhas sintéticas com as colunas configuradas, sob demanda
+
+    Args:
+        quantidade: Número de linhas
+        colunas: Nomes das colunas
+    """
+    inicio = date(2025, 1, 1)
+    for i in range(quantidade):
+        yield {
+            coluna: (
+                inicio + timedelta(days=i % 28) if coluna == "Data de Emissão"
+                else float(i % 1000) / 7 if coluna.startswith(("Valor", "Quantidade", "Base"))
+                else f"{coluna} {i // 10}"
+            )
+            for coluna in colunas
+        }
+
+
+def pico_memoria_mb():
+    """Retorna o pico de RSS do processo atual em MB (Linux/macOS)"""
+    import resource
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss é dado em KB no Linux e em bytes no macOS
+    return pico / (1024 * 1024) if sys.platform == "darwin" else pico / 1024
+
+
+def executar(modo, quantidade):
+    """
+    Executa uma exportação e imprime "segundos pico_mb"; chamado no processo filho
+
+    Args:
+        modo: "pandas" ou "streaming"
+        quantidade: Número de linhas
+    """
+    import pandas as pd
+
+    from excel_export import _salvar_planilha, exportar_linhas_streaming
+    from xml_parser import COLUNA_CHAVE, obter_plano_extracao
+
+    colunas = obter_plano_extracao().colunas + [COLUNA_CHAVE]
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho_excel = Path(pasta) / "benchmark.xlsx"
+        inicio = time.perf_counter()
+        if modo == "pandas":
+            _salvar_planilha(pd.DataFrame(list(gerar_linhas(quantidade, colunas))), caminho_excel)
+        else:
+            exportar_linhas_streaming(gerar_linhas(quantidade, colunas), caminho_excel, colunas)
+        duracao = time.perf_counter() - inicio
+    print(f"{duracao:.2f} {pico_memoria_mb():.1f}")
+
+
+def main(quantidades):
+    """
+    Executa todas as combinações de modo e quantidade e imprime a tabela de resultados
+
+    Args:
+        quantidades: Quantidades de linhas a medir
+    """
+    print(f"{'linhas':>10} {'modo':>10} {'tempo (s)':>10} {'pico RSS (MB)':>14}")
+    for quantidade in quantidades:
+        for modo in MODOS:
+            resultado = subprocess.run(
+                [sys.executable, __file__, "--executar", modo, str(quantidade)],
+                capture_output=True, text=True, cwd=Path(__file__).parent
+            )
+            if resultado.returncode != 0:
+                print(f"{quantidade:>10} {modo:>10} erro: {resultado.stderr.strip().splitlines()[-1]}")
+                continue
+            duracao, pico = resultado.stdout.split()[-2:]
+            print(f"{quantidade:>10} {modo:>10} {duracao:>10} {pico:>14}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--executar":
+        executar(sys.argv[2], int(sys.argv[3]))
+    else:
+        main([int(q) for q in sys.argv[1:]] or QUANTIDADES_PADRAO)
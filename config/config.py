@@ -3,6 +3,25 @@ import os
 from pathlib import Path
 
 
+# Campos extraídos de cada NF-e. Caminhos de escopo "documento" são relativos
+# a infNFe; os de escopo "item" são relativos a cada elemento det.
+CAMPOS_PADRAO = [
+    {"coluna": "Data de Emissão", "caminho": "ide/dhEmi", "tipo": "data", "escopo": "documento"},
+    {"coluna": "Nome do Fornecedor", "caminho": "emit/xNome", "tipo": "texto", "escopo": "documento"},
+    {"coluna": "CNPJ do Fornecedor", "caminho": "emit/CNPJ", "tipo": "texto", "escopo": "documento"},
+    {"coluna": "Número da Nota", "caminho": "ide/nNF", "tipo": "texto", "escopo": "documento"},
+    {"coluna": "Descrição do Produto", "caminho": "prod/xProd", "tipo": "texto", "escopo": "item"},
+    {"coluna": "NCM", "caminho": "prod/NCM", "tipo": "texto", "escopo": "item"},
+    {"coluna": "CFOP", "caminho": "prod/CFOP", "tipo": "texto", "escopo": "item"},
+    {"coluna": "Quantidade", "caminho": "prod/qCom", "tipo": "decimal", "escopo": "item"},
+    {"coluna": "Valor Unitário", "caminho": "prod/vUnCom", "tipo": "decimal", "escopo": "item"},
+    {"coluna": "Valor do Item", "caminho": "prod/vProd", "tipo": "decimal", "escopo": "item"},
+    {"coluna": "Base de Cálculo ICMS", "caminho": "total/ICMSTot/vBC", "tipo": "decimal", "escopo": "documento"},
+    {"coluna": "Valor do ICMS", "caminho": "total/ICMSTot/vICMS", "tipo": "decimal", "escopo": "documento"},
+    {"coluna": "Valor Total da Nota", "caminho": "total/ICMSTot/vNF", "tipo": "decimal", "escopo": "documento"},
+]
+
+
 class Config:
     """Gerenciador centralizado de configurações do sistema"""
     
@@ -15,7 +34,11 @@ class Config:
         # Configurações padrão
         self.DEFAULT_CONFIG = {
             "output_directory": str(self.ROOT_DIR / "planilhas"),
-            "verificar_duplicatas": True
+            "verificar_duplicatas": True,
+            "exportacao_streaming": True,
+            "cache_memoria_mb": 256,
+            "limite_linhas_preview": 200000,
+            "campos": CAMPOS_PADRAO
         }
         
         # Carrega as configurações do arquivo ou usa padrões
@@ -53,6 +76,26 @@ class Config:
         """Se devem ser verificadas entradas duplicadas nas planilhas"""
         return self._config.get("verificar_duplicatas", True)
     
+    @property
+    def exportacao_streaming(self):
+        """Se o processamento em lote grava as planilhas em modo streaming (memória constante)"""
+        return self._config.get("exportacao_streaming", True)
+    
+    @property
+    def cache_memoria_mb(self):
+        """Memória máxima, em MB, das planilhas mantidas em cache pela interface gráfica"""
+        return self._config.get("cache_memoria_mb", 256)
+    
+    @property
+    def limite_linhas_preview(self):
+        """Quantidade máxima de itens carregados na pré-visualização do processamento em lote (~450 bytes cada)"""
+        return self._config.get("limite_linhas_preview", 200000)
+    
+    @property
+    def campos(self):
+        """Especificação dos campos extraídos de cada nota (coluna, caminho, tipo, escopo)"""
+        return self._config.get("campos", CAMPOS_PADRAO)
+    
     def save(self):
         """Salva as configurações atuais no arquivo"""
         self._save_config(self._config)
@@ -65,7 +108,11 @@ def load_config():
     """Função de compatibilidade - Retorna o dicionário de configurações"""
     return {
         "output_directory": str(config.output_directory),
-        "verificar_duplicatas": config.verificar_duplicatas
+        "verificar_duplicatas": config.verificar_duplicatas,
+        "exportacao_streaming": config.exportacao_streaming,
+        "cache_memoria_mb": config.cache_memoria_mb,
+        "limite_linhas_preview": config.limite_linhas_preview,
+        "campos": config.campos
     }
 
 def save_config(config_data):
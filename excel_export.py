@@ -1,32 +1,68 @@
 import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date
 from pathlib import Path
-from typing import List, Optional, Union
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 import pandas as pd
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
 
 from config.config import config
-from xml_parser import extrair_dados_xml, obter_nome_mes
+from xml_parser import (COLUNA_CHAVE, converter_valor, extrair_documento, identificar_documento,
+                        obter_nome_mes, obter_nome_mes_chave, obter_plano_extracao)
 
 # Define o diretório de saída
 OUTPUT_DIR = config.output_directory
 
-def gerar_planilha(caminho_xml: Union[str, Path]) -> Optional[str]:
+# Formato de exibição das colunas de data nas planilhas
+FORMATO_DATA_EXCEL = "DD/MM/YYYY"
+
+# Arquivo, na pasta de saída, com as chaves de acesso das notas canceladas já importadas
+ARQUIVO_CANCELADAS = "notas_canceladas.txt"
+
+def gerar_planilha(caminho_xml: Union[str, Path], documento: Optional[Dict] = None,
+                   cache: Optional["CachePlanilhas"] = None) -> Optional[str]:
     """
     Gera uma planilha Excel com os dados do XML
     
+    Eventos de cancelamento removem da planilha as linhas da nota cancelada.
+    
     Args:
         caminho_xml: Caminho para o arquivo XML
+        documento: Resultado de extrair_documento, se o XML já foi extraído
+        cache: Cache de planilhas. Se fornecido, a planilha é alterada em memória
+               e gravada em segundo plano pelo cache.
         
     Returns:
         Caminho da planilha gerada ou None em caso de erro
     """
     try:
-        dados, data_emissao = extrair_dados_xml(caminho_xml)
+        if documento is None:
+            documento = extrair_documento(caminho_xml)
+        if documento is None:
+            print(f"Não foi possível extrair dados do XML: {caminho_xml}")
+            return None
+        
+        if documento["chaves_canceladas"]:
+            planilhas = remover_notas_canceladas(documento["chaves_canceladas"], cache)
+            return planilhas[0] if planilhas else None
         
+        dados, data_emissao = documento["dados"], documento["data_emissao"]
         if not dados:
             print(f"Não foi possível extrair dados do XML: {caminho_xml}")
             return None
         
+        # O cancelamento pode ter sido importado antes da própria nota
+        canceladas = ler_chaves_canceladas()
+        dados = [linha for linha in dados if linha.get(COLUNA_CHAVE) not in canceladas]
+        if not dados:
+            print(f"Nota cancelada anteriormente, dados ignorados: {caminho_xml}")
+            return None
+        
         # Obtém o nome do mês para o nome do arquivo
         nome_mes = obter_nome_mes(data_emissao)
         
@@ -40,26 +76,24 @@ def gerar_planilha(caminho_xml: Union[str, Path]) -> Optional[str]:
         if not os.path.exists(OUTPUT_DIR):
             os.makedirs(OUTPUT_DIR, exist_ok=True)
         
+        if cache is not None:
+            # A gravação fica a cargo do cache (write-behind)
+            if not cache.adicionar(caminho_excel, dados):
+                print("Todos os dados já existem na planilha. Nenhuma atualização necessária.")
+            print(f"Planilha atualizada em memória: {caminho_excel}")
+            return str(caminho_excel)
+        
         # Verifica se o arquivo já existe para adicionar dados ou criar um novo
+        df_existente = None
         if os.path.exists(caminho_excel):
             try:
-                df_existente = pd.read_excel(caminho_excel)
-                
-                # Verificação de duplicatas (condicional conforme configuração)
-                if config.verificar_duplicatas:
-                    df_final = adicionar_sem_duplicatas(df, df_existente)
-                else:
-                    # Apenas concatena os dados
-                    df_final = pd.concat([df_existente, df], ignore_index=True)
-                    
+                df_existente = _ler_planilha(caminho_excel)
             except Exception as e:
                 print(f"Erro ao ler arquivo existente: {e}")
-                df_final = df
-        else:
-            df_final = df
+        df_final = _combinar(df, df_existente)
         
         # Salva o DataFrame no arquivo Excel
-        df_final.to_excel(caminho_excel, index=False)
+        _salvar_planilha(df_final, caminho_excel)
         print(f"Planilha gerada com sucesso: {caminho_excel}")
         return str(caminho_excel)
     
@@ -67,6 +101,213 @@ def gerar_planilha(caminho_xml: Union[str, Path]) -> Optional[str]:
         print(f"Erro ao gerar planilha: {str(e)}")
         return None
 
+def _combinar(df_novo: pd.DataFrame, df_existente: Optional[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Acrescenta os novos dados aos existentes, verificando duplicatas conforme a configuração
+    
+    Args:
+        df_novo: DataFrame com os novos dados
+        df_existente: DataFrame com os dados existentes, ou None se a planilha não existe
+        
+    Returns:
+        DataFrame combinado
+    """
+    if df_existente is None:
+        return df_novo
+    if config.verificar_duplicatas:
+        return adicionar_sem_duplicatas(df_novo, df_existente)
+    # Apenas concatena os dados
+    return pd.concat([df_existente, df_novo], ignore_index=True)
+
+def _remover_chaves(df: Optional[pd.DataFrame], chaves: set) -> Optional[pd.DataFrame]:
+    """
+    Remove do DataFrame as linhas cujas chaves de acesso estão no conjunto informado
+    
+    Args:
+        df: DataFrame da planilha, ou None se a planilha não existe
+        chaves: Chaves de acesso das notas canceladas
+        
+    Returns:
+        DataFrame sem as linhas das notas canceladas
+    """
+    if df is None or COLUNA_CHAVE not in df.columns:
+        return df
+    return df[~df[COLUNA_CHAVE].isin(chaves)].reset_index(drop=True)
+
+def _salvar_planilha(df: pd.DataFrame, caminho_excel: Path) -> None:
+    """
+    Grava o DataFrame no arquivo Excel, formatando as colunas de data
+    
+    Args:
+        df: DataFrame a ser gravado
+        caminho_excel: Caminho do arquivo Excel
+    """
+    with pd.ExcelWriter(caminho_excel, engine="openpyxl") as writer:
+        df.to_excel(writer, index=False)
+        # O engine openpyxl do pandas ignora date_format; aplica o formato célula a célula
+        for linha in writer.sheets["Sheet1"].iter_rows(min_row=2):
+            for celula in linha:
+                if celula.is_date:
+                    celula.number_format = FORMATO_DATA_EXCEL
+
+def _ler_planilha(caminho_excel: Path) -> pd.DataFrame:
+    """
+    Lê uma planilha existente, mantendo como texto as colunas de tipo texto
+    
+    Sem isso o pandas converte identificadores como a chave de acesso e o NCM em números.
+    
+    Args:
+        caminho_excel: Caminho do arquivo Excel
+        
+    Returns:
+        DataFrame com os dados da planilha
+    """
+    colunas_texto = {
+        campo["coluna"]: str for campo in config.campos if campo.get("tipo", "texto") == "texto"
+    }
+    colunas_texto[COLUNA_CHAVE] = str
+    df = pd.read_excel(caminho_excel, dtype=colunas_texto)
+    for coluna, tipo in _tipos_colunas().items():
+        if tipo == "texto" or coluna not in df.columns:
+            continue
+        if pd.api.types.is_numeric_dtype(df[coluna]) or pd.api.types.is_datetime64_any_dtype(df[coluna]):
+            continue
+        df[coluna] = df[coluna].astype(object).map(
+            lambda valor: _converter_existente(valor, tipo), na_action="ignore"
+        )
+    return df
+
+# Tipos Python aceitos, sem conversão, para cada tipo de campo
+_TIPOS_PYTHON = {"texto": str, "inteiro": (int, float), "decimal": (int, float), "data": date}
+
+def _tipos_colunas() -> Dict[str, str]:
+    """Tipo configurado de cada coluna (coluna -> tipo)"""
+    tipos = {campo["coluna"]: campo.get("tipo", "texto") for campo in config.campos}
+    tipos[COLUNA_CHAVE] = "texto"
+    return tipos
+
+def _converter_existente(valor, tipo: str):
+    """Converte um valor lido de uma planilha para o tipo do campo, se ainda não estiver nele"""
+    if valor is None or isinstance(valor, _TIPOS_PYTHON[tipo]):
+        return valor
+    return converter_valor(str(valor), tipo)
+
+def _normalizar_tipos(linhas: Iterable[Dict]) -> Iterator[Dict]:
+    """
+    Converte as linhas existentes de uma planilha para os tipos configurados
+    
+    Planilhas gravadas por versões anteriores têm datas e valores como texto
+    ("15/01/2025", "15.00"); sem a conversão, as colunas ficariam com tipos
+    misturados ao receber as novas linhas, o que atrapalha a ordenação e os
+    filtros no Excel.
+    
+    Args:
+        linhas: Linhas lidas da planilha, consumidas sob demanda
+    """
+    tipos = _tipos_colunas()
+    for linha in linhas:
+        for coluna, valor in linha.items():
+            tipo = tipos.get(coluna)
+            if tipo is not None:
+                linha[coluna] = _converter_existente(valor, tipo)
+        yield linha
+
+def remover_notas_canceladas(chaves: List[str], cache: Optional["CachePlanilhas"] = None) -> List[str]:
+    """
+    Remove das planilhas mensais as linhas das notas canceladas
+    
+    A planilha de cada nota é localizada pelo mês de emissão contido na chave de acesso.
+    As chaves também são registradas, para que a nota seja descartada se for
+    importada depois do cancelamento.
+    
+    Args:
+        chaves: Chaves de acesso das notas canceladas
+        cache: Cache de planilhas. Se fornecido, a remoção é feita em memória.
+        
+    Returns:
+        Lista com os caminhos das planilhas alteradas
+    """
+    registrar_chaves_canceladas(chaves)
+    chaves_por_mes = {}
+    for chave in chaves:
+        nome_mes = obter_nome_mes_chave(chave)
+        if nome_mes:
+            chaves_por_mes.setdefault(nome_mes, set()).add(chave)
+    
+    planilhas_alteradas = []
+    for nome_mes, chaves_mes in chaves_por_mes.items():
+        caminho_excel = OUTPUT_DIR / f"{nome_mes}.xlsx"
+        
+        try:
+            if cache is not None:
+                removidas = cache.cancelar(caminho_excel, chaves_mes)
+            else:
+                if not os.path.exists(caminho_excel):
+                    continue
+                df = _ler_planilha(caminho_excel)
+                if COLUNA_CHAVE not in df.columns:
+                    print(f"Planilha sem a coluna '{COLUNA_CHAVE}', cancelamento ignorado: {caminho_excel}")
+                    continue
+                removidas = int(df[COLUNA_CHAVE].isin(chaves_mes).sum())
+                if removidas:
+                    _salvar_planilha(_remover_chaves(df, chaves_mes), caminho_excel)
+            
+            if not removidas:
+                continue
+            print(f"{removidas} linhas de notas canceladas removidas de {caminho_excel}")
+            planilhas_alteradas.append(str(caminho_excel))
+        except Exception as e:
+            print(f"Erro ao remover notas canceladas de {caminho_excel}: {e}")
+    
+    return planilhas_alteradas
+
+_lock_canceladas = threading.Lock()
+_canceladas_lidas: Dict = {"caminho": None, "mtime": None, "chaves": set()}
+
+def ler_chaves_canceladas() -> set:
+    """
+    Chaves de acesso das notas canceladas registradas na pasta de saída
+    
+    O arquivo só é relido quando sua data de modificação muda.
+    
+    Returns:
+        Conjunto com as chaves de acesso
+    """
+    caminho = OUTPUT_DIR / ARQUIVO_CANCELADAS
+    with _lock_canceladas:
+        mtime = _mtime(caminho)
+        if _canceladas_lidas["caminho"] != caminho or _canceladas_lidas["mtime"] != mtime:
+            chaves = set()
+            if mtime is not None:
+                try:
+                    with open(caminho, 'r', encoding='utf-8') as arquivo:
+                        chaves = {linha.strip() for linha in arquivo if linha.strip()}
+                except Exception as e:
+                    print(f"Erro ao ler as notas canceladas: {e}")
+            _canceladas_lidas.update(caminho=caminho, mtime=mtime, chaves=chaves)
+        return set(_canceladas_lidas["chaves"])
+
+def registrar_chaves_canceladas(chaves: Iterable[str]) -> None:
+    """
+    Acrescenta ao registro da pasta de saída as chaves de notas canceladas ainda não registradas
+    
+    Args:
+        chaves: Chaves de acesso das notas canceladas
+    """
+    novas = sorted(set(chaves) - ler_chaves_canceladas())
+    if not novas:
+        return
+    caminho = OUTPUT_DIR / ARQUIVO_CANCELADAS
+    with _lock_canceladas:
+        try:
+            os.makedirs(OUTPUT_DIR, exist_ok=True)
+            with open(caminho, 'a', encoding='utf-8') as arquivo:
+                arquivo.writelines(f"{chave}\n" for chave in novas)
+        except Exception as e:
+            print(f"Erro ao registrar as notas canceladas: {e}")
+        # Força a releitura na próxima consulta
+        _canceladas_lidas["mtime"] = None
+
 def adicionar_sem_duplicatas(df_novo: pd.DataFrame, df_existente: pd.DataFrame) -> pd.DataFrame:
     """
     Adiciona novos dados sem duplicatas ao DataFrame existente
@@ -79,23 +320,620 @@ def adicionar_sem_duplicatas(df_novo: pd.DataFrame, df_existente: pd.DataFrame)
         DataFrame combinado sem duplicatas
     """
     # Assumindo que a combinação de Número da Nota e Descrição do Produto é única
-    chaves_existentes = set()
-    for _, row in df_existente.iterrows():
-        chaves_existentes.add((row['Número da Nota'], row['Descrição do Produto']))
+    chaves_existentes = set(zip(df_existente['Número da Nota'], df_existente['Descrição do Produto']))
     
     # Filtra os novos dados para excluir duplicatas
-    novos_dados = []
-    for _, row in df_novo.iterrows():
-        chave = (row['Número da Nota'], row['Descrição do Produto'])
-        if chave not in chaves_existentes:
-            novos_dados.append(row)
+    novos = [
+        chave not in chaves_existentes
+        for chave in zip(df_novo['Número da Nota'], df_novo['Descrição do Produto'])
+    ]
     
-    if not novos_dados:
+    if not any(novos):
         print("Todos os dados já existem na planilha. Nenhuma atualização necessária.")
         return df_existente
     
-    df_novos = pd.DataFrame(novos_dados)
-    return pd.concat([df_existente, df_novos], ignore_index=True)
+    return pd.concat([df_existente, df_novo[novos]], ignore_index=True)
+
+class EscritorPlanilhaStreaming:
+    """
+    Grava linhas em uma planilha Excel no modo write-only do openpyxl.
+    
+    Cada linha é serializada no momento em que é escrita, de modo que o uso de
+    memória não depende da quantidade de linhas. A planilha é gravada em um
+    arquivo temporário e só substitui o arquivo final em salvar().
+    """
+    
+    def __init__(self, caminho_excel: Union[str, Path], colunas: List[str]):
+        """
+        Cria a planilha e escreve o cabeçalho
+        
+        Args:
+            caminho_excel: Caminho final do arquivo Excel
+            colunas: Nomes das colunas, na ordem em que serão gravadas
+        """
+        self.caminho_excel = Path(caminho_excel)
+        self.colunas = list(colunas)
+        self.linhas_escritas = 0
+        self._workbook = Workbook(write_only=True)
+        self._planilha = self._workbook.create_sheet(title="Sheet1")
+        self._planilha.append(self.colunas)
+    
+    def escrever(self, linha: Dict) -> None:
+        """
+        Escreve uma linha, preenchendo com vazio as colunas ausentes
+        
+        Args:
+            linha: Dicionário com os valores da linha
+        """
+        self._planilha.append([self._celula(linha.get(coluna)) for coluna in self.colunas])
+        self.linhas_escritas += 1
+    
+    def escrever_linhas(self, linhas: Iterable[Dict]) -> None:
+        """
+        Escreve todas as linhas de um iterável, consumindo-o sob demanda
+        
+        Args:
+            linhas: Iterável de dicionários
+        """
+        for linha in linhas:
+            self.escrever(linha)
+    
+    def salvar(self) -> str:
+        """
+        Finaliza a planilha e substitui o arquivo final
+        
+        Returns:
+            Caminho do arquivo Excel gravado
+        """
+        caminho_temporario = self.caminho_excel.with_name(f"~{self.caminho_excel.name}")
+        try:
+            self._workbook.save(caminho_temporario)
+            os.replace(caminho_temporario, self.caminho_excel)
+        except Exception:
+            # Ex.: planilha aberta no Excel; não deixa o temporário para trás
+            if os.path.exists(caminho_temporario):
+                os.remove(caminho_temporario)
+            raise
+        return str(self.caminho_excel)
+    
+    def _celula(self, valor):
+        """Aplica o formato de data às células de data; demais valores são gravados diretamente"""
+        if isinstance(valor, date):
+            celula = WriteOnlyCell(self._planilha, value=valor)
+            celula.number_format = FORMATO_DATA_EXCEL
+            return celula
+        return valor
+
+def exportar_linhas_streaming(linhas: Iterable[Dict], caminho_excel: Union[str, Path],
+                              colunas: List[str]) -> str:
+    """
+    Grava as linhas de um iterador em uma planilha Excel com uso de memória constante
+    
+    Args:
+        linhas: Iterável de dicionários, consumido sob demanda
+        caminho_excel: Caminho do arquivo Excel
+        colunas: Nomes das colunas da planilha
+        
+    Returns:
+        Caminho do arquivo Excel gravado
+    """
+    escritor = EscritorPlanilhaStreaming(caminho_excel, colunas)
+    escritor.escrever_linhas(linhas)
+    return escritor.salvar()
+
+def ler_planilha_streaming(caminho_excel: Union[str, Path]) -> Tuple[List[str], Iterator[Dict]]:
+    """
+    Lê uma planilha existente no modo read-only do openpyxl, linha a linha
+    
+    Args:
+        caminho_excel: Caminho do arquivo Excel
+        
+    Returns:
+        tuple: (colunas, linhas) - Cabeçalho e iterador de dicionários com as linhas.
+        O arquivo permanece aberto até que o iterador seja consumido.
+    """
+    workbook = load_workbook(caminho_excel, read_only=True)
+    linhas = workbook.active.iter_rows(values_only=True)
+    colunas = [str(c) for c in next(linhas, ()) if c is not None]
+    
+    def iterar():
+        try:
+            for valores in linhas:
+                if any(v is not None for v in valores):
+                    yield dict(zip(colunas, valores))
+        finally:
+            workbook.close()
+    
+    return colunas, iterar()
+
+def _chave_duplicata(linha: Dict) -> Tuple:
+    """Chave usada na verificação de duplicatas (Número da Nota, Descrição do Produto)"""
+    numero = linha.get('Número da Nota')
+    return (str(numero) if numero is not None else None, linha.get('Descrição do Produto'))
+
+# Estimativas de memória usadas pelo CachePlanilhas (bytes)
+MEMORIA_POR_CHAVE = 250
+MEMORIA_POR_LINHA = 1500
+
+class _EntradaCache:
+    """
+    Estado de uma planilha mensal mantido pelo CachePlanilhas
+    
+    Guarda apenas o necessário para importar sem reler o arquivo: as chaves de
+    duplicata e as notas já presentes, as linhas acrescentadas ainda não
+    gravadas e as notas canceladas ainda não removidas do arquivo.
+    """
+    
+    def __init__(self, mtime: Optional[int]):
+        self.mtime = mtime
+        self.chaves: Dict[Tuple, Optional[str]] = {}  # chave de duplicata -> chave de acesso
+        self.notas: Dict[Optional[str], int] = {}      # chave de acesso -> quantidade de linhas
+        self.linhas_novas: List[Dict] = []
+        self.canceladas: set = set()
+        self.pendente_desde: Optional[float] = None
+        self.gravando = False
+        self.falha_notificada = False
+    
+    @property
+    def pendente(self) -> bool:
+        """Se há alterações ainda não gravadas no arquivo"""
+        return bool(self.linhas_novas or self.canceladas)
+    
+    @property
+    def tamanho(self) -> int:
+        """Estimativa da memória ocupada pela entrada"""
+        return len(self.chaves) * MEMORIA_POR_CHAVE + len(self.linhas_novas) * MEMORIA_POR_LINHA
+    
+    def registrar(self, linha: Dict) -> bool:
+        """
+        Registra uma linha nas chaves e notas, respeitando a verificação de duplicatas
+        
+        Returns:
+            False se a linha é duplicata de uma já existente
+        """
+        chave_acesso = linha.get(COLUNA_CHAVE)
+        if config.verificar_duplicatas:
+            chave = _chave_duplicata(linha)
+            if chave in self.chaves:
+                return False
+            self.chaves[chave] = chave_acesso
+        self.notas[chave_acesso] = self.notas.get(chave_acesso, 0) + 1
+        return True
+    
+    def esquecer(self, chaves_acesso: set) -> int:
+        """
+        Remove das chaves e notas as linhas das notas informadas
+        
+        Returns:
+            Quantidade de linhas removidas
+        """
+        removidas = sum(self.notas.pop(chave, 0) for chave in chaves_acesso)
+        if removidas and self.chaves:
+            self.chaves = {k: c for k, c in self.chaves.items() if c not in chaves_acesso}
+        return removidas
+
+class CachePlanilhas:
+    """
+    Cache em memória das planilhas mensais, para importações sucessivas pela interface.
+    
+    Para cada planilha usada recentemente são mantidas as chaves de duplicata
+    e as notas presentes, em uma LRU limitada pelo uso estimado de memória e
+    validada pela data de modificação do arquivo. Cada importação só processa
+    as próprias linhas, que ficam em memória até serem gravadas em segundo
+    plano (write-behind): após um período sem alterações, quando a alteração
+    pendente mais antiga excede o intervalo máximo, quando outra planilha
+    passa a ser alterada e em descarregar(), que deve ser chamado ao fechar a
+    aplicação. A gravação copia o arquivo atual com o EscritorPlanilhaStreaming,
+    descartando as notas canceladas e acrescentando as linhas pendentes.
+    
+    Se o arquivo for modificado por outro programa nesse meio tempo, as chaves
+    são relidas dele e as alterações pendentes são reaplicadas. Se a gravação
+    falhar (ex.: planilha aberta no Excel), as alterações continuam pendentes:
+    descarregar() retorna as falhas e as gravações em segundo plano as
+    informam por ao_falhar.
+    
+    Quem grava as planilhas diretamente (ex.: processamento em lote) deve
+    fazê-lo dentro de gravacao_exclusiva(), para que uma gravação do cache
+    não seja sobrescrita pela substituição do arquivo ao final do lote.
+    """
+    
+    def __init__(self, limite_memoria_mb: float = 256, atraso_ocioso: float = 2.0,
+                 intervalo_maximo: float = 30.0,
+                 ao_falhar: Optional[Callable[[List[Tuple[str, str]]], None]] = None):
+        """
+        Args:
+            limite_memoria_mb: Memória máxima estimada das planilhas já gravadas
+            atraso_ocioso: Segundos sem alterações após os quais as pendências são gravadas
+            intervalo_maximo: Tempo máximo, em segundos, que uma alteração fica sem ser gravada
+            ao_falhar: Função chamada, na thread de gravação, com as falhas das gravações
+                       em segundo plano. Cada planilha é informada uma vez até voltar a ser gravada.
+        """
+        self.limite_memoria = limite_memoria_mb * 1024 * 1024
+        self.atraso_ocioso = atraso_ocioso
+        self.intervalo_maximo = intervalo_maximo
+        self.ao_falhar = ao_falhar
+        self._entradas: "OrderedDict[Path, _EntradaCache]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._lock_gravacao = threading.RLock()
+        self._timer: Optional[threading.Timer] = None
+        self._ultima_planilha: Optional[Path] = None
+    
+    def adicionar(self, caminho_excel: Union[str, Path], linhas: List[Dict]) -> int:
+        """
+        Acrescenta linhas à planilha em memória e agenda sua gravação
+        
+        Args:
+            caminho_excel: Caminho do arquivo Excel
+            linhas: Linhas a acrescentar
+            
+        Returns:
+            Quantidade de linhas acrescentadas (descontadas as duplicatas)
+        """
+        caminho_excel = Path(caminho_excel)
+        with self._lock:
+            entrada = self._carregar(caminho_excel)
+            novas = [linha for linha in linhas if entrada.registrar(linha)]
+            entrada.linhas_novas.extend(novas)
+            self._marcar_pendente(caminho_excel, entrada, bool(novas))
+        self._agendar_gravacao_apos_alteracao(caminho_excel)
+        return len(novas)
+    
+    def cancelar(self, caminho_excel: Union[str, Path], chaves_acesso: set) -> int:
+        """
+        Remove da planilha em memória as linhas das notas canceladas e agenda a gravação
+        
+        Args:
+            caminho_excel: Caminho do arquivo Excel
+            chaves_acesso: Chaves de acesso das notas canceladas
+            
+        Returns:
+            Quantidade de linhas removidas
+        """
+        caminho_excel = Path(caminho_excel)
+        chaves_acesso = set(chaves_acesso)
+        with self._lock:
+            entrada = self._carregar(caminho_excel)
+            removidas = entrada.esquecer(chaves_acesso)
+            if removidas:
+                entrada.linhas_novas = [
+                    linha for linha in entrada.linhas_novas if linha.get(COLUNA_CHAVE) not in chaves_acesso
+                ]
+                entrada.canceladas |= chaves_acesso
+            self._marcar_pendente(caminho_excel, entrada, bool(removidas))
+        if removidas:
+            self._agendar_gravacao_apos_alteracao(caminho_excel)
+        return removidas
+    
+    def descarregar(self, caminho_excel: Optional[Union[str, Path]] = None) -> List[Tuple[str, str]]:
+        """
+        Grava imediatamente as alterações pendentes
+        
+        Args:
+            caminho_excel: Planilha a gravar. Se não fornecido, grava todas.
+            
+        Returns:
+            Lista de (caminho, mensagem de erro) das planilhas que não puderam ser
+            gravadas; suas alterações continuam pendentes
+        """
+        with self._lock:
+            if caminho_excel is None:
+                caminhos = [c for c, e in self._entradas.items() if e.pendente]
+            else:
+                caminhos = [Path(caminho_excel)]
+        
+        falhas = []
+        for caminho in caminhos:
+            erro = self._gravar(caminho)
+            if erro is not None:
+                falhas.append((str(caminho), erro))
+        with self._lock:
+            self._liberar_memoria()
+        return falhas
+    
+    @contextmanager
+    def gravacao_exclusiva(self):
+        """
+        Grava as pendências e suspende as gravações do cache até o fim do bloco
+        
+        As importações continuam sendo aceitas em memória; são gravadas depois,
+        sobre o arquivo produzido dentro do bloco.
+        
+        Yields:
+            Falhas de descarregar(), como lista de (caminho, mensagem de erro)
+        """
+        with self._lock_gravacao:
+            yield self.descarregar()
+    
+    def pendentes(self) -> List[str]:
+        """Caminhos das planilhas com alterações ainda não gravadas"""
+        with self._lock:
+            return [str(c) for c, e in self._entradas.items() if e.pendente]
+    
+    def _carregar(self, caminho_excel: Path) -> _EntradaCache:
+        """Retorna a entrada da planilha, relendo o arquivo se ele foi alterado externamente"""
+        entrada = self._entradas.get(caminho_excel)
+        if entrada is not None and entrada.gravando:
+            return entrada
+        
+        mtime = _mtime(caminho_excel)
+        if entrada is not None and entrada.mtime == mtime:
+            return entrada
+        
+        nova = _EntradaCache(mtime)
+        if mtime is not None:
+            try:
+                _, existentes = ler_planilha_streaming(caminho_excel)
+                for linha in existentes:
+                    nova.registrar(linha)
+            except Exception as e:
+                print(f"Erro ao ler arquivo existente: {e}")
+        
+        if entrada is not None and entrada.pendente:
+            print(f"Planilha alterada externamente, reaplicando alterações pendentes: {caminho_excel}")
+            nova.esquecer(entrada.canceladas)
+            nova.canceladas = entrada.canceladas
+            nova.linhas_novas = [linha for linha in entrada.linhas_novas if nova.registrar(linha)]
+            nova.pendente_desde = entrada.pendente_desde
+            nova.falha_notificada = entrada.falha_notificada
+        
+        self._entradas[caminho_excel] = nova
+        return nova
+    
+    def _marcar_pendente(self, caminho_excel: Path, entrada: _EntradaCache, alterou: bool) -> None:
+        """Atualiza a ordem LRU e o início da pendência da entrada"""
+        if alterou and entrada.pendente_desde is None:
+            entrada.pendente_desde = time.monotonic()
+        self._entradas.move_to_end(caminho_excel)
+    
+    def _agendar_gravacao_apos_alteracao(self, caminho_excel: Path) -> None:
+        """Grava em segundo plano agora (troca de planilha, atraso ou memória) ou após o período ocioso"""
+        with self._lock:
+            trocou_planilha = self._ultima_planilha not in (None, caminho_excel)
+            self._ultima_planilha = caminho_excel
+            agora = time.monotonic()
+            atrasada = any(
+                e.pendente_desde is not None and agora - e.pendente_desde >= self.intervalo_maximo
+                for e in self._entradas.values()
+            )
+            excedeu_memoria = not self._liberar_memoria()
+        
+        if trocou_planilha or atrasada or excedeu_memoria:
+            threading.Thread(target=self._descarregar_em_segundo_plano, daemon=True).start()
+        else:
+            self._agendar_gravacao()
+    
+    def _descarregar_em_segundo_plano(self) -> None:
+        """Grava as pendências fora da thread da interface e informa as novas falhas"""
+        falhas = self.descarregar()
+        with self._lock:
+            novas_falhas = []
+            for caminho, erro in falhas:
+                entrada = self._entradas.get(Path(caminho))
+                if entrada is not None and not entrada.falha_notificada:
+                    entrada.falha_notificada = True
+                    novas_falhas.append((caminho, erro))
+        if novas_falhas and self.ao_falhar is not None:
+            self.ao_falhar(novas_falhas)
+    
+    def _gravar(self, caminho_excel: Path) -> Optional[str]:
+        """
+        Grava as alterações pendentes de uma planilha sem bloquear novas alterações
+        
+        Returns:
+            Mensagem de erro, ou None se a gravação foi concluída (ou não havia pendências)
+        """
+        with self._lock_gravacao:
+            with self._lock:
+                entrada = self._entradas.get(caminho_excel)
+                if entrada is None or not entrada.pendente:
+                    return None
+                # O arquivo pode ter sido regravado desde a importação (ex.: por um lote)
+                entrada = self._carregar(caminho_excel)
+                if not entrada.pendente:
+                    return None
+                novas = list(entrada.linhas_novas)
+                canceladas = set(entrada.canceladas)
+                entrada.gravando = True
+            
+            try:
+                _gravar_alteracoes_streaming(caminho_excel, novas, canceladas)
+                print(f"Planilha gerada com sucesso: {caminho_excel}")
+            except Exception as e:
+                print(f"Erro ao gravar planilha {caminho_excel}: {e}")
+                with self._lock:
+                    entrada.gravando = False
+                return str(e)
+            
+            with self._lock:
+                # Alterações feitas durante a gravação continuam pendentes
+                gravadas = {id(linha) for linha in novas}
+                entrada.linhas_novas = [l for l in entrada.linhas_novas if id(l) not in gravadas]
+                entrada.canceladas -= canceladas
+                entrada.pendente_desde = time.monotonic() if entrada.pendente else None
+                entrada.mtime = _mtime(caminho_excel)
+                entrada.gravando = False
+                entrada.falha_notificada = False
+            return None
+    
+    def _agendar_gravacao(self) -> None:
+        """Reinicia o temporizador que grava as pendências após o período ocioso"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.atraso_ocioso, self._descarregar_em_segundo_plano)
+            self._timer.daemon = True
+            self._timer.start()
+    
+    def _liberar_memoria(self) -> bool:
+        """
+        Remove as planilhas menos usadas até respeitar o limite de memória
+        
+        Planilhas com alterações pendentes não são removidas antes de serem gravadas.
+        
+        Returns:
+            True se o uso de memória ficou dentro do limite
+        """
+        total = sum(e.tamanho for e in self._entradas.values())
+        for caminho in list(self._entradas):
+            if total <= self.limite_memoria:
+                break
+            entrada = self._entradas[caminho]
+            if entrada.pendente or entrada.gravando or caminho == self._ultima_planilha:
+                continue
+            total -= entrada.tamanho
+            del self._entradas[caminho]
+        return total <= self.limite_memoria
+
+def _gravar_alteracoes_streaming(caminho_excel: Path, linhas_novas: List[Dict], canceladas: set) -> None:
+    """
+    Regrava a planilha em modo streaming, sem as notas canceladas e com as linhas novas
+    
+    Args:
+        caminho_excel: Caminho do arquivo Excel
+        linhas_novas: Linhas a acrescentar ao final
+        canceladas: Chaves de acesso cujas linhas existentes devem ser descartadas
+    """
+    if os.path.exists(caminho_excel):
+        colunas, existentes = ler_planilha_streaming(caminho_excel)
+    else:
+        colunas, existentes = [], (linha for linha in ())
+    
+    try:
+        colunas_novas = dict.fromkeys(coluna for linha in linhas_novas for coluna in linha)
+        colunas += [coluna for coluna in colunas_novas if coluna not in colunas]
+        
+        if not os.path.exists(caminho_excel.parent):
+            os.makedirs(caminho_excel.parent, exist_ok=True)
+        escritor = EscritorPlanilhaStreaming(caminho_excel, colunas)
+        escritor.escrever_linhas(
+            linha for linha in _normalizar_tipos(existentes) if linha.get(COLUNA_CHAVE) not in canceladas
+        )
+        escritor.escrever_linhas(linhas_novas)
+    finally:
+        # Fecha a planilha lida antes de substituí-la
+        existentes.close()
+    escritor.salvar()
+
+def _mtime(caminho: Path) -> Optional[int]:
+    """Data de modificação do arquivo em nanossegundos, ou None se ele não existe"""
+    try:
+        return os.stat(caminho).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def _processar_lote_streaming(notas: List[Tuple[Path, Optional[Dict]]],
+                              cancelamentos: List[Tuple[Path, Optional[Dict]]]) -> List[str]:
+    """
+    Processa um lote gravando cada planilha mensal uma única vez, em modo streaming
+    
+    Os cancelamentos são lidos primeiro, e as notas são extraídas à medida que
+    são gravadas por exportar_documentos, sem manter as linhas em memória.
+    
+    Args:
+        notas: Arquivos de notas e suas identificações
+        cancelamentos: Arquivos de eventos de cancelamento e suas identificações
+        
+    Returns:
+        Lista com os caminhos das planilhas geradas
+    """
+    chaves_canceladas = set()
+    for arquivo, identificacao in cancelamentos:
+        print(f"Processando {arquivo.name}...")
+        documento = extrair_documento(arquivo, identificacao=identificacao)
+        if documento:
+            chaves_canceladas.update(documento["chaves_canceladas"])
+    
+    def extrair_notas():
+        for arquivo, identificacao in notas:
+            print(f"Processando {arquivo.name}...")
+            documento = extrair_documento(arquivo, identificacao=identificacao)
+            if documento:
+                yield documento
+    
+    return exportar_documentos(extrair_notas(), chaves_canceladas)
+
+def exportar_documentos(documentos: Iterable[Dict], chaves_canceladas: Iterable[str] = ()) -> List[str]:
+    """
+    Grava documentos já extraídos nas planilhas mensais, em modo streaming
+    
+    Cada planilha mensal é aberta no primeiro documento do mês: as linhas
+    existentes são copiadas e as novas são acrescentadas à medida que os
+    documentos são percorridos. As linhas das notas canceladas são descartadas
+    e apenas as chaves de duplicata são mantidas, quando a verificação está ativa.
+    
+    Args:
+        documentos: Documentos no formato de extrair_documento; "dados" pode ser
+            qualquer iterável de linhas
+        chaves_canceladas: Chaves de acesso das notas canceladas no lote. São
+            registradas e somadas às já registradas na pasta de saída.
+        
+    Returns:
+        Lista com os caminhos das planilhas geradas
+    """
+    canceladas_lote = set(chaves_canceladas)
+    registrar_chaves_canceladas(canceladas_lote)
+    chaves_canceladas = canceladas_lote | ler_chaves_canceladas()
+    colunas_plano = obter_plano_extracao().colunas + [COLUNA_CHAVE]
+    escritores = {}
+    chaves_por_mes = {}
+    
+    def abrir_planilha(nome_mes):
+        caminho_excel = OUTPUT_DIR / f"{nome_mes}.xlsx"
+        colunas, existentes = [], iter(())
+        if os.path.exists(caminho_excel):
+            try:
+                colunas, existentes = ler_planilha_streaming(caminho_excel)
+            except Exception as e:
+                print(f"Erro ao ler arquivo existente: {e}")
+        colunas += [coluna for coluna in colunas_plano if coluna not in colunas]
+        
+        escritor = EscritorPlanilhaStreaming(caminho_excel, colunas)
+        chaves = set()
+        for linha in _normalizar_tipos(existentes):
+            if linha.get(COLUNA_CHAVE) in chaves_canceladas:
+                continue
+            if config.verificar_duplicatas:
+                chaves.add(_chave_duplicata(linha))
+            escritor.escrever(linha)
+        escritores[nome_mes] = escritor
+        chaves_por_mes[nome_mes] = chaves
+    
+    if not os.path.exists(OUTPUT_DIR):
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+    
+    for documento in documentos:
+        if not documento["dados"] or not documento["data_emissao"]:
+            continue
+        
+        nome_mes = obter_nome_mes(documento["data_emissao"])
+        if nome_mes not in escritores:
+            abrir_planilha(nome_mes)
+        escritor, chaves = escritores[nome_mes], chaves_por_mes[nome_mes]
+        
+        for linha in documento["dados"]:
+            if linha.get(COLUNA_CHAVE) in chaves_canceladas:
+                continue
+            if config.verificar_duplicatas:
+                chave = _chave_duplicata(linha)
+                if chave in chaves:
+                    continue
+                chaves.add(chave)
+            escritor.escrever(linha)
+    
+    # Meses que só recebem cancelamentos também precisam ser regravados
+    for chave in canceladas_lote:
+        nome_mes = obter_nome_mes_chave(chave)
+        if nome_mes and nome_mes not in escritores and os.path.exists(OUTPUT_DIR / f"{nome_mes}.xlsx"):
+            abrir_planilha(nome_mes)
+    
+    planilhas_geradas = []
+    for escritor in escritores.values():
+        try:
+            planilhas_geradas.append(escritor.salvar())
+            print(f"Planilha gerada com sucesso: {escritor.caminho_excel} ({escritor.linhas_escritas} linhas)")
+        except Exception as e:
+            print(f"Erro ao gravar planilha {escritor.caminho_excel}: {e}")
+    return planilhas_geradas
 
 def processar_multiplos_xmls(pasta_xmls: Optional[Union[str, Path]] = None) -> List[str]:
     """
@@ -120,12 +958,30 @@ def processar_multiplos_xmls(pasta_xmls: Optional[Union[str, Path]] = None) -> L
         return planilhas_geradas
     
     print(f"Encontrados {len(arquivos_xml)} arquivos XML")
+    
+    # Identifica os documentos pelo cabeçalho; cancelamentos são aplicados por último,
+    # depois que as notas do lote já estiverem nas planilhas
+    notas, cancelamentos = [], []
     for arquivo in arquivos_xml:
+        identificacao = identificar_documento(arquivo)
+        if identificacao and identificacao["tipo"] == "Cancelamento NF-e":
+            cancelamentos.append((arquivo, identificacao))
+        else:
+            notas.append((arquivo, identificacao))
+    
+    if config.exportacao_streaming:
+        return _processar_lote_streaming(notas, cancelamentos)
+    
+    for arquivo, identificacao in notas + cancelamentos:
         print(f"Processando {arquivo.name}...")
-        caminho_planilha = gerar_planilha(arquivo)
+        documento = extrair_documento(arquivo, identificacao=identificacao)
+        if documento is None:
+            continue
+        caminho_planilha = gerar_planilha(arquivo, documento)
         if caminho_planilha:
             print(f"Dados de {arquivo.name} adicionados a {caminho_planilha}")
-            planilhas_geradas.append(caminho_planilha)
+            if caminho_planilha not in planilhas_geradas:
+                planilhas_geradas.append(caminho_planilha)
     
     return planilhas_geradas
 
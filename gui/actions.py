@@ -3,12 +3,14 @@ Funções e ações da interface gráfica
 """
 import os
 import threading
+from contextlib import nullcontext
 from pathlib import Path
-from tkinter import Tk, filedialog, messagebox
+from tkinter import DISABLED, NORMAL, Tk, filedialog, messagebox
 
 from config.config import config
-from excel_export import gerar_planilha, processar_multiplos_xmls
-from xml_parser import extrair_dados_xml
+from excel_export import (CachePlanilhas, exportar_documentos, gerar_planilha, ler_chaves_canceladas,
+                          processar_multiplos_xmls)
+from xml_parser import COLUNA_CHAVE, extrair_documento, obter_plano_extracao
 
 
 def selecionar_arquivo(entry):
@@ -40,7 +42,7 @@ def selecionar_pasta(entry):
         entry.insert(0, pasta)
 
 
-def processar_arquivo(entry_arquivo, root, status_label):
+def processar_arquivo(entry_arquivo, root, status_label, cache=None, ui_elements=None):
     """
     Processa um único arquivo XML e atualiza a interface
     
@@ -48,6 +50,9 @@ def processar_arquivo(entry_arquivo, root, status_label):
         entry_arquivo: Widget Entry com o caminho do arquivo
         root: Janela principal da aplicação
         status_label: Label para exibir o status do processamento
+        cache: Cache de planilhas da sessão
+        ui_elements: Elementos da interface. Se fornecido, os itens são exibidos na
+                     pré-visualização e só são exportados após a confirmação.
     """
     arquivo = entry_arquivo.get()
     if not arquivo:
@@ -71,7 +76,7 @@ def processar_arquivo(entry_arquivo, root, status_label):
         # Executar o processamento em uma thread separada
         threading.Thread(
             target=_processar_arquivo_thread,
-            args=(caminho, root, status_label)
+            args=(caminho, root, status_label, cache, ui_elements)
         ).start()
         
     except Exception as e:
@@ -79,7 +84,7 @@ def processar_arquivo(entry_arquivo, root, status_label):
         status_label.config(text="")
 
 
-def _processar_arquivo_thread(caminho, root, status_label):
+def _processar_arquivo_thread(caminho, root, status_label, cache=None, ui_elements=None):
     """
     Thread para processamento de arquivo sem bloquear a interface
     
@@ -87,28 +92,65 @@ def _processar_arquivo_thread(caminho, root, status_label):
         caminho: Caminho do arquivo XML
         root: Janela principal da aplicação
         status_label: Label para exibir o status do processamento
+        cache: Cache de planilhas da sessão
+        ui_elements: Elementos da interface, para a pré-visualização
     """
     try:
-        # Extrair dados para verificar se o XML é válido
-        dados, data = extrair_dados_xml(caminho)
-        if dados:
-            # Gerar a planilha Excel
-            caminho_planilha = gerar_planilha(caminho)
-            
-            if caminho_planilha:
-                # Usar o after para atualizar a interface do usuário da thread principal
-                root.after(0, lambda: mostrar_sucesso(dados, caminho_planilha, root))
-            else:
-                root.after(0, lambda: messagebox.showerror("Erro", "Não foi possível gerar a planilha Excel"))
+        # Extrair dados para verificar se o XML é válido e suportado
+        documento = extrair_documento(caminho)
+        if not documento or not (documento["dados"] or documento["chaves_canceladas"]):
+            root.after(0, lambda: messagebox.showerror(
+                "Erro", "Não foi possível extrair dados do arquivo (documento inválido ou não suportado)"))
+        elif ui_elements is not None:
+            colunas = _colunas_preview()
+            linhas, canceladas = _linhas_preview([_compactar_documento(dict(documento), colunas)], colunas)
+            root.after(0, lambda: mostrar_preview(
+                ui_elements, colunas, linhas, canceladas,
+                lambda: _exportar_arquivo(caminho, documento, root, cache, status_label)
+            ))
         else:
-            root.after(0, lambda: messagebox.showerror("Erro", "Não foi possível extrair dados do arquivo"))
+            _exportar_arquivo(caminho, documento, root, cache, status_label)
     except Exception as e:
         root.after(0, lambda: messagebox.showerror("Erro", f"Ocorreu um erro: {str(e)}"))
     finally:
         root.after(0, lambda: status_label.config(text=""))
 
 
-def mostrar_sucesso(dados, caminho_planilha, root):
+def _exportar_arquivo(caminho, documento, root, cache=None, status_label=None):
+    """
+    Grava na planilha os dados de um arquivo já extraído e exibe o resultado
+    
+    Args:
+        caminho: Caminho do arquivo XML
+        documento: Resultado de extrair_documento
+        root: Janela principal da aplicação
+        cache: Cache de planilhas da sessão
+        status_label: Label para exibir o status do processamento
+    """
+    if documento["chaves_canceladas"]:
+        caminho_planilha = gerar_planilha(caminho, documento, cache)
+        if caminho_planilha:
+            root.after(0, lambda: messagebox.showinfo(
+                "Sucesso", f"Nota cancelada removida da planilha {caminho_planilha}"))
+        else:
+            root.after(0, lambda: messagebox.showinfo(
+                "Aviso", "A nota cancelada não foi encontrada em nenhuma planilha."))
+    elif documento["dados"][0].get(COLUNA_CHAVE) in ler_chaves_canceladas():
+        root.after(0, lambda: messagebox.showinfo(
+            "Aviso", "Esta nota já foi cancelada; seus itens não foram exportados."))
+    else:
+        dados = documento["dados"]
+        # Gerar a planilha Excel
+        caminho_planilha = gerar_planilha(caminho, documento, cache)
+        
+        if caminho_planilha:
+            # Usar o after para atualizar a interface do usuário da thread principal
+            root.after(0, lambda: mostrar_sucesso(dados, caminho_planilha, root, cache, status_label))
+        else:
+            root.after(0, lambda: messagebox.showerror("Erro", "Não foi possível gerar a planilha Excel"))
+
+
+def mostrar_sucesso(dados, caminho_planilha, root, cache=None, status_label=None):
     """
     Exibe mensagem de sucesso e oferece opção de abrir a planilha gerada
     
@@ -116,17 +158,69 @@ def mostrar_sucesso(dados, caminho_planilha, root):
         dados: Dados processados do XML
         caminho_planilha: Caminho da planilha gerada
         root: Janela principal da aplicação
+        cache: Cache de planilhas da sessão
+        status_label: Label para exibir o status da gravação
     """
+    if cache is not None:
+        destino = (f"Itens adicionados à planilha: {caminho_planilha}\n"
+                   f"A gravação em disco é feita em segundo plano.")
+    else:
+        destino = f"Planilha salva em: {caminho_planilha}"
     messagebox.showinfo("Sucesso", 
                       f"Arquivo processado com sucesso!\n"
                       f"{len(dados)} itens encontrados.\n"
-                      f"Planilha salva em: {caminho_planilha}")
+                      f"{destino}")
     # Oferecer opção para abrir a planilha
     if messagebox.askyesno("Abrir Arquivo", "Deseja abrir a planilha agora?"):
+        if cache is None:
+            os.startfile(caminho_planilha)
+            return
+        
+        # Grava as alterações ainda pendentes no cache antes de abrir, fora da thread da interface
+        if status_label is not None:
+            status_label.config(text="Gravando planilha...")
+        
+        def gravar_e_abrir():
+            falhas = cache.descarregar(caminho_planilha)
+            root.after(0, lambda: _abrir_apos_gravacao(caminho_planilha, falhas, status_label))
+        
+        threading.Thread(target=gravar_e_abrir).start()
+
+
+def _abrir_apos_gravacao(caminho_planilha, falhas, status_label=None):
+    """
+    Abre a planilha se a gravação das pendências foi concluída, ou informa a falha
+    
+    Args:
+        caminho_planilha: Caminho da planilha
+        falhas: Lista de (caminho, erro) retornada por CachePlanilhas.descarregar
+        status_label: Label para exibir o status da gravação
+    """
+    if status_label is not None:
+        status_label.config(text="")
+    if falhas:
+        avisar_falha_gravacao(falhas)
+    else:
         os.startfile(caminho_planilha)
 
 
-def processar_pasta(entry_pasta, root, status_label):
+def avisar_falha_gravacao(falhas):
+    """
+    Informa as planilhas que não puderam ser gravadas; as importações continuam pendentes
+    
+    Args:
+        falhas: Lista de (caminho, erro) das planilhas não gravadas
+    """
+    detalhes = "\n".join(f"{caminho}: {erro}" for caminho, erro in falhas)
+    messagebox.showwarning(
+        "Erro ao gravar planilha",
+        f"Não foi possível gravar as planilhas abaixo. As importações continuam "
+        f"pendentes e serão gravadas na próxima tentativa. Verifique se a planilha "
+        f"não está aberta no Excel.\n\n{detalhes}"
+    )
+
+
+def processar_pasta(entry_pasta, root, status_label, cache=None, ui_elements=None):
     """
     Processa todos os arquivos XML em uma pasta
     
@@ -134,6 +228,9 @@ def processar_pasta(entry_pasta, root, status_label):
         entry_pasta: Widget Entry com o caminho da pasta
         root: Janela principal da aplicação
         status_label: Label para exibir o status do processamento
+        cache: Cache de planilhas da sessão
+        ui_elements: Elementos da interface. Se fornecido, os itens são exibidos na
+                     pré-visualização e só são exportados após a confirmação.
     """
     pasta = entry_pasta.get()
     if not pasta:
@@ -153,7 +250,7 @@ def processar_pasta(entry_pasta, root, status_label):
         # Executar o processamento em uma thread separada
         threading.Thread(
             target=_processar_pasta_thread,
-            args=(caminho, root, status_label)
+            args=(caminho, root, status_label, cache, ui_elements)
         ).start()
         
     except Exception as e:
@@ -161,7 +258,7 @@ def processar_pasta(entry_pasta, root, status_label):
         status_label.config(text="")
 
 
-def _processar_pasta_thread(caminho, root, status_label):
+def _processar_pasta_thread(caminho, root, status_label, cache=None, ui_elements=None):
     """
     Thread para processamento de pasta sem bloquear a interface
     
@@ -169,16 +266,132 @@ def _processar_pasta_thread(caminho, root, status_label):
         caminho: Caminho da pasta contendo arquivos XML
         root: Janela principal da aplicação
         status_label: Label para exibir o status do processamento
+        cache: Cache de planilhas da sessão
+        ui_elements: Elementos da interface, para a pré-visualização
     """
     try:
-        planilhas = processar_multiplos_xmls(caminho)
-        root.after(0, lambda: mostrar_resultado_pasta(planilhas, root))
+        if ui_elements is None:
+            _exportar_pasta(caminho, root, cache)
+            return
+        
+        # As linhas ficam em tuplas, bem menores que dicionários, e são as mesmas
+        # exportadas na confirmação; acima do limite a pré-visualização é abandonada
+        arquivos_xml = list(caminho.glob('*.xml'))
+        colunas = _colunas_preview()
+        documentos = []
+        total_linhas = 0
+        for numero, arquivo in enumerate(arquivos_xml, start=1):
+            documento = extrair_documento(arquivo)
+            if documento:
+                documentos.append(_compactar_documento(documento, colunas))
+                total_linhas += len(documento["dados"])
+                if total_linhas > config.limite_linhas_preview:
+                    root.after(0, lambda: _oferecer_exportacao_direta(caminho, root, status_label, cache))
+                    return
+            if numero % 100 == 0:
+                root.after(0, lambda n=numero: status_label.config(
+                    text=f"Lendo arquivos da pasta... {n}/{len(arquivos_xml)}"))
+        
+        if documentos:
+            linhas, canceladas = _linhas_preview(documentos, colunas)
+            root.after(0, lambda: mostrar_preview(
+                ui_elements, colunas, linhas, canceladas,
+                lambda: _exportar_documentos(colunas, documentos, root, cache)
+            ))
+        else:
+            root.after(0, lambda: messagebox.showinfo("Aviso", "Nenhum documento suportado encontrado na pasta."))
     except Exception as e:
         root.after(0, lambda: messagebox.showerror("Erro", f"Ocorreu um erro: {str(e)}"))
     finally:
         root.after(0, lambda: status_label.config(text=""))
 
 
+def _exportar_pasta(caminho, root, cache=None):
+    """
+    Processa os arquivos da pasta para as planilhas e exibe o resultado
+    
+    Args:
+        caminho: Caminho da pasta contendo arquivos XML
+        root: Janela principal da aplicação
+        cache: Cache de planilhas da sessão
+    """
+    _gravar_lote(root, cache, lambda: processar_multiplos_xmls(caminho))
+
+
+def _exportar_documentos(colunas, documentos, root, cache=None):
+    """
+    Grava nas planilhas os documentos exibidos na pré-visualização e exibe o resultado
+    
+    A gravação é sempre feita em modo streaming (exportar_documentos),
+    independentemente de config.exportacao_streaming.
+    
+    Args:
+        colunas: Colunas das tuplas de cada documento
+        documentos: Documentos compactados por _compactar_documento
+        root: Janela principal da aplicação
+        cache: Cache de planilhas da sessão
+    """
+    chaves_canceladas = {chave for documento in documentos for chave in documento["chaves_canceladas"]}
+    _gravar_lote(root, cache, lambda: exportar_documentos(
+        (
+            dict(documento, dados=(dict(zip(colunas, linha)) for linha in documento["dados"]))
+            for documento in documentos
+        ),
+        chaves_canceladas
+    ))
+
+
+def _gravar_lote(root, cache, exportar):
+    """
+    Executa a gravação de um lote e exibe o resultado
+    
+    O lote grava diretamente nos arquivos: as pendências do cache são gravadas
+    antes e as gravações do cache ficam suspensas até o fim do lote, para que
+    importações feitas nesse meio tempo não sejam sobrescritas.
+    
+    Args:
+        root: Janela principal da aplicação
+        cache: Cache de planilhas da sessão
+        exportar: Função que grava o lote e retorna as planilhas geradas
+    """
+    with cache.gravacao_exclusiva() if cache is not None else nullcontext([]) as falhas:
+        if falhas:
+            root.after(0, lambda: avisar_falha_gravacao(falhas))
+            return
+        planilhas = exportar()
+    root.after(0, lambda: mostrar_resultado_pasta(planilhas, root))
+
+
+def _oferecer_exportacao_direta(caminho, root, status_label, cache=None):
+    """
+    Pergunta se uma pasta grande demais para a pré-visualização deve ser exportada diretamente
+    
+    Args:
+        caminho: Caminho da pasta contendo arquivos XML
+        root: Janela principal da aplicação
+        status_label: Label para exibir o status do processamento
+        cache: Cache de planilhas da sessão
+    """
+    limite = f"{config.limite_linhas_preview:,}".replace(",", ".")
+    if not messagebox.askyesno(
+        "Pré-visualização",
+        f"A pasta tem mais de {limite} itens, acima do limite da pré-visualização.\n"
+        f"Deseja exportar diretamente, sem pré-visualizar?"
+    ):
+        return
+    status_label.config(text="Exportando para o Excel...")
+    
+    def exportar():
+        try:
+            _exportar_pasta(caminho, root, cache)
+        except Exception as e:
+            root.after(0, lambda: messagebox.showerror("Erro", f"Ocorreu um erro: {str(e)}"))
+        finally:
+            root.after(0, lambda: status_label.config(text=""))
+    
+    threading.Thread(target=exportar).start()
+
+
 def mostrar_resultado_pasta(planilhas, root):
     """
     Exibe resultado do processamento em lote e oferece opção para abrir pasta
@@ -199,6 +412,198 @@ def mostrar_resultado_pasta(planilhas, root):
         messagebox.showinfo("Aviso", "Nenhuma planilha foi gerada ou atualizada.")
 
 
+def _colunas_preview():
+    """Colunas exibidas na pré-visualização: as do plano de extração e a chave de acesso"""
+    return obter_plano_extracao().colunas + [COLUNA_CHAVE]
+
+
+def _compactar_documento(documento, colunas):
+    """
+    Substitui as linhas do documento por tuplas na ordem das colunas
+    
+    Args:
+        documento: Resultado de extrair_documento (alterado no lugar)
+        colunas: Ordem dos valores em cada tupla
+        
+    Returns:
+        O próprio documento
+    """
+    documento["dados"] = [tuple(linha.get(coluna) for coluna in colunas) for linha in documento["dados"]]
+    return documento
+
+
+def _linhas_preview(documentos, colunas):
+    """
+    Reúne as linhas exibidas na pré-visualização, sem as notas canceladas
+    
+    São descartadas as notas canceladas no lote e as já registradas como
+    canceladas em importações anteriores.
+    
+    Args:
+        documentos: Documentos compactados por _compactar_documento
+        colunas: Colunas das tuplas
+        
+    Returns:
+        tuple: (linhas, quantidade de notas canceladas no lote)
+    """
+    canceladas_lote = {chave for documento in documentos for chave in documento["chaves_canceladas"]}
+    chaves_canceladas = canceladas_lote | ler_chaves_canceladas()
+    indice_chave = colunas.index(COLUNA_CHAVE)
+    linhas = [
+        linha
+        for documento in documentos
+        for linha in documento["dados"]
+        if linha[indice_chave] not in chaves_canceladas
+    ]
+    return linhas, len(canceladas_lote)
+
+
+def mostrar_preview(ui_elements, colunas, linhas, canceladas, ao_confirmar):
+    """
+    Exibe na pré-visualização os itens extraídos e aguarda a confirmação da exportação
+    
+    Args:
+        ui_elements: Elementos da interface
+        colunas: Nomes das colunas
+        linhas: Tuplas com os valores de cada item, na ordem das colunas
+        canceladas: Quantidade de notas canceladas no lote
+        ao_confirmar: Função executada em segundo plano quando a exportação é confirmada
+    """
+    ui_elements['preview_canceladas'] = canceladas
+    ui_elements['entry_filtro_preview'].delete(0, 'end')
+    ui_elements['grade_preview'].carregar(colunas, linhas)
+    ui_elements['btn_confirmar_preview'].config(
+        state=NORMAL, command=lambda: confirmar_preview(ui_elements, ao_confirmar)
+    )
+    ui_elements['btn_descartar_preview'].config(state=NORMAL)
+    ui_elements['notebook'].select(ui_elements['tab_preview'])
+
+
+def _atualizar_resumo_preview(ui_elements, visiveis, total):
+    """
+    Atualiza o resumo da pré-visualização (itens exibidos e notas canceladas)
+    
+    Args:
+        ui_elements: Elementos da interface
+        visiveis: Quantidade de itens que atendem ao filtro
+        total: Quantidade total de itens
+    """
+    if not total and not ui_elements.get('preview_canceladas'):
+        texto = "Nenhum dado para pré-visualizar"
+    else:
+        texto = f"{visiveis:,} de {total:,} itens".replace(",", ".")
+        if ui_elements.get('preview_canceladas'):
+            texto += f" | {ui_elements['preview_canceladas']} notas canceladas serão removidas"
+    ui_elements['label_preview'].config(text=texto)
+
+
+def filtrar_preview(ui_elements):
+    """
+    Agenda a aplicação do filtro da pré-visualização, aguardando o fim da digitação
+    
+    Args:
+        ui_elements: Elementos da interface
+    """
+    grade = ui_elements['grade_preview']
+    if ui_elements.get('job_filtro_preview'):
+        grade.after_cancel(ui_elements['job_filtro_preview'])
+    ui_elements['job_filtro_preview'] = grade.after(
+        150, lambda: grade.filtrar(ui_elements['entry_filtro_preview'].get())
+    )
+
+
+def confirmar_preview(ui_elements, ao_confirmar):
+    """
+    Exporta para o Excel os dados em pré-visualização
+    
+    Args:
+        ui_elements: Elementos da interface
+        ao_confirmar: Função que grava os dados nas planilhas
+    """
+    root = ui_elements['root']
+    status_label = ui_elements['status_label']
+    descartar_preview(ui_elements)
+    status_label.config(text="Exportando para o Excel...")
+    root.update_idletasks()
+    
+    def exportar():
+        try:
+            ao_confirmar()
+        except Exception as e:
+            root.after(0, lambda: messagebox.showerror("Erro", f"Ocorreu um erro: {str(e)}"))
+        finally:
+            root.after(0, lambda: status_label.config(text=""))
+    
+    threading.Thread(target=exportar).start()
+
+
+def descartar_preview(ui_elements):
+    """
+    Limpa a pré-visualização sem exportar os dados
+    
+    Args:
+        ui_elements: Elementos da interface
+    """
+    ui_elements['preview_canceladas'] = 0
+    ui_elements['entry_filtro_preview'].delete(0, 'end')
+    ui_elements['grade_preview'].limpar()
+    ui_elements['btn_confirmar_preview'].config(state=DISABLED)
+    ui_elements['btn_descartar_preview'].config(state=DISABLED)
+
+
+def fechar_janela(root, cache, status_label):
+    """
+    Grava as alterações pendentes no cache e fecha a janela principal
+    
+    A gravação é feita fora da thread da interface. Se alguma planilha não
+    puder ser gravada, o operador pode tentar novamente ou cancelar o
+    fechamento, mantendo as importações pendentes.
+    
+    Args:
+        root: Janela principal da aplicação
+        cache: Cache de planilhas da sessão
+        status_label: Label para exibir o status da gravação
+    """
+    if not cache.pendentes():
+        root.destroy()
+        return
+    
+    status_label.config(text="Gravando planilhas pendentes...")
+    root.protocol("WM_DELETE_WINDOW", lambda: None)  # Ignora novos pedidos durante a gravação
+    
+    def gravar():
+        falhas = cache.descarregar()
+        root.after(0, lambda: _concluir_fechamento(root, cache, status_label, falhas))
+    
+    threading.Thread(target=gravar).start()
+
+
+def _concluir_fechamento(root, cache, status_label, falhas):
+    """
+    Fecha a janela após a gravação ou pergunta ao operador como prosseguir
+    
+    Args:
+        root: Janela principal da aplicação
+        cache: Cache de planilhas da sessão
+        status_label: Label para exibir o status da gravação
+        falhas: Lista de (caminho, erro) retornada por CachePlanilhas.descarregar
+    """
+    status_label.config(text="")
+    root.protocol("WM_DELETE_WINDOW", lambda: fechar_janela(root, cache, status_label))
+    if not falhas:
+        root.destroy()
+        return
+    
+    detalhes = "\n".join(f"{caminho}: {erro}" for caminho, erro in falhas)
+    if messagebox.askretrycancel(
+        "Erro ao gravar planilha",
+        f"Não foi possível gravar as planilhas abaixo. Feche-as no Excel e tente "
+        f"novamente, ou cancele para manter a janela aberta com as importações "
+        f"pendentes.\n\n{detalhes}"
+    ):
+        fechar_janela(root, cache, status_label)
+
+
 def registrar_acoes(ui_elements):
     """
     Registra todas as ações nos elementos da interface
@@ -206,6 +611,17 @@ def registrar_acoes(ui_elements):
     Args:
         ui_elements (dict): Dicionário contendo os elementos da interface
     """
+    # Cache das planilhas mensais mantido durante a sessão
+    root = ui_elements['root']
+    cache = CachePlanilhas(
+        config.cache_memoria_mb,
+        ao_falhar=lambda falhas: root.after(0, lambda: avisar_falha_gravacao(falhas))
+    )
+    ui_elements['cache_planilhas'] = cache
+    root.protocol(
+        "WM_DELETE_WINDOW", lambda: fechar_janela(root, cache, ui_elements['status_label'])
+    )
+    
     # Registra ações para a aba de arquivo único
     ui_elements['btn_selecionar_arquivo'].config(
         command=lambda: selecionar_arquivo(ui_elements['entry_arquivo'])
@@ -214,7 +630,9 @@ def registrar_acoes(ui_elements):
         command=lambda: processar_arquivo(
             ui_elements['entry_arquivo'], 
             ui_elements['root'],
-            ui_elements['status_label']
+            ui_elements['status_label'],
+            cache,
+            ui_elements
         )
     )
     
@@ -226,6 +644,19 @@ def registrar_acoes(ui_elements):
         command=lambda: processar_pasta(
             ui_elements['entry_pasta'], 
             ui_elements['root'],
-            ui_elements['status_label']
+            ui_elements['status_label'],
+            cache,
+            ui_elements
         )
+    )
+    
+    # Registra ações para a aba de pré-visualização
+    ui_elements['grade_preview'].ao_atualizar = (
+        lambda visiveis, total: _atualizar_resumo_preview(ui_elements, visiveis, total)
+    )
+    ui_elements['entry_filtro_preview'].bind(
+        '<KeyRelease>', lambda event: filtrar_preview(ui_elements)
+    )
+    ui_elements['btn_descartar_preview'].config(
+        command=lambda: descartar_preview(ui_elements)
     )
\ No newline at end of file
@@ -2,8 +2,15 @@
 Layout da interface gráfica do processador de XML
 """
 import tkinter as tk
+from datetime import date
 from tkinter import ttk
 
+# Colunas usadas pelo filtro da pré-visualização
+COLUNAS_FILTRO_PREVIEW = ("Nome do Fornecedor", "Número da Nota")
+
+# Quantidade de linhas verificadas por vez pelo filtro, entre atualizações da interface
+TAMANHO_LOTE_FILTRO = 50000
+
 
 def criar_interface():
     """
@@ -15,7 +22,7 @@ def criar_interface():
     # Criar a interface
     root = tk.Tk()
     root.title("Processador de Notas Fiscais XML")
-    root.geometry("540x380")  # Tamanho para acomodar o notebook e a barra de status
+    root.geometry("900x600")  # Tamanho para acomodar o notebook, a pré-visualização e a barra de status
 
     # Criar o notebook (abas)
     notebook = ttk.Notebook(root)
@@ -27,6 +34,7 @@ def criar_interface():
     # Criar as abas
     _criar_aba_arquivo_unico(notebook, ui_elements)
     _criar_aba_processamento_lote(notebook, ui_elements)
+    _criar_aba_preview(notebook, ui_elements)
     
     # Adiciona uma barra de status na janela principal
     _criar_barra_status(root, ui_elements)
@@ -143,6 +151,256 @@ def _criar_aba_processamento_lote(notebook, ui_elements):
     })
 
 
+def _criar_aba_preview(notebook, ui_elements):
+    """
+    Cria a aba de pré-visualização dos itens extraídos antes da exportação
+    
+    Args:
+        notebook: Widget Notebook para adicionar a aba
+        ui_elements: Dicionário para armazenar os elementos da interface
+    """
+    tab_preview = ttk.Frame(notebook)
+    notebook.add(tab_preview, text="Pré-visualização")
+
+    # Filtro por fornecedor ou número da nota
+    frame_filtro = ttk.Frame(tab_preview)
+    frame_filtro.pack(fill="x", padx=10, pady=(10, 5))
+
+    ttk.Label(frame_filtro, text="Filtrar (fornecedor ou nº da nota):").pack(side=tk.LEFT)
+    entry_filtro_preview = ttk.Entry(frame_filtro, width=40)
+    entry_filtro_preview.pack(side=tk.LEFT, padx=5)
+
+    label_preview = ttk.Label(frame_filtro, text="Nenhum dado para pré-visualizar")
+    label_preview.pack(side=tk.RIGHT)
+
+    # Grade virtualizada com os itens extraídos
+    grade_preview = GradeVirtual(tab_preview, colunas_filtro=COLUNAS_FILTRO_PREVIEW)
+    grade_preview.pack(fill="both", expand=True, padx=10)
+
+    # Botões de confirmação
+    frame_botoes = ttk.Frame(tab_preview)
+    frame_botoes.pack(fill="x", padx=10, pady=10)
+
+    btn_descartar_preview = ttk.Button(frame_botoes, text="Descartar", state=tk.DISABLED)
+    btn_descartar_preview.pack(side=tk.RIGHT)
+
+    btn_confirmar_preview = ttk.Button(frame_botoes, text="Exportar para Excel", state=tk.DISABLED)
+    btn_confirmar_preview.pack(side=tk.RIGHT, padx=5)
+
+    # Armazena os widgets no dicionário
+    ui_elements.update({
+        'tab_preview': tab_preview,
+        'entry_filtro_preview': entry_filtro_preview,
+        'label_preview': label_preview,
+        'grade_preview': grade_preview,
+        'btn_confirmar_preview': btn_confirmar_preview,
+        'btn_descartar_preview': btn_descartar_preview
+    })
+
+
+class GradeVirtual(ttk.Frame):
+    """
+    Grade somente leitura que renderiza apenas as linhas visíveis.
+    
+    As linhas ficam em uma lista Python de tuplas e o Treeview contém somente os itens da
+    janela visível, recriados a cada rolagem. Assim o custo de exibição e de
+    rolagem não depende da quantidade de linhas carregadas.
+    """
+
+    def __init__(self, master, colunas_filtro=(), ao_atualizar=None, **kwargs):
+        """
+        Args:
+            master: Widget pai
+            colunas_filtro: Colunas consultadas pelo filtro
+            ao_atualizar: Função chamada com (linhas_visiveis, total) após cada atualização
+        """
+        super().__init__(master, **kwargs)
+        self.colunas_filtro = colunas_filtro
+        self.ao_atualizar = ao_atualizar
+
+        self.tree = ttk.Treeview(self, show="headings", selectmode="browse")
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self._rolar_barra)
+        scrollbar_h = ttk.Scrollbar(self, orient=tk.HORIZONTAL, command=self.tree.xview)
+        self.tree.configure(xscrollcommand=scrollbar_h.set)
+
+        self.tree.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        scrollbar_h.grid(row=1, column=0, sticky="ew")
+        self.rowconfigure(0, weight=1)
+        self.columnconfigure(0, weight=1)
+
+        self._colunas = []
+        self._indices_filtro = []
+        self._linhas = []
+        self._indices = None  # None = todas as linhas, sem filtro
+        self._chaves_busca = []
+        self._filtro = ""
+        self._filtro_completo = True
+        self._job_filtro = None
+        self._inicio = 0
+        self._altura = 10
+
+        self.tree.bind("<Configure>", self._ao_redimensionar)
+        self.tree.bind("<MouseWheel>", lambda e: self._rolar(-e.delta // 120 * 3))
+        self.tree.bind("<Button-4>", lambda e: self._rolar(-3))
+        self.tree.bind("<Button-5>", lambda e: self._rolar(3))
+        self.tree.bind("<Prior>", lambda e: self._rolar(-self._altura))
+        self.tree.bind("<Next>", lambda e: self._rolar(self._altura))
+
+    @property
+    def total_visivel(self):
+        """Quantidade de linhas que atendem ao filtro atual"""
+        return len(self._linhas) if self._indices is None else len(self._indices)
+
+    def carregar(self, colunas, linhas):
+        """
+        Substitui o conteúdo da grade
+        
+        Args:
+            colunas: Nomes das colunas exibidas
+            linhas: Lista de tuplas com os valores de cada linha, na ordem das colunas
+        """
+        self._cancelar_filtro()
+        self._colunas = list(colunas)
+        self._indices_filtro = [self._colunas.index(c) for c in self.colunas_filtro if c in self._colunas]
+        self._linhas = linhas
+        self._indices = None
+        self._chaves_busca = []
+        self._filtro = ""
+        self._filtro_completo = True
+        self._inicio = 0
+
+        self.tree.configure(columns=self._colunas)
+        for coluna in self._colunas:
+            self.tree.heading(coluna, text=coluna)
+            self.tree.column(coluna, width=max(90, len(coluna) * 8), stretch=False)
+        self._renderizar()
+
+    def limpar(self):
+        """Remove todas as linhas e colunas da grade"""
+        self.carregar([], [])
+
+    def filtrar(self, texto):
+        """
+        Exibe apenas as linhas cujas colunas de filtro contêm o texto
+        
+        A busca é feita em lotes, entre atualizações da interface. Quando o novo
+        texto estende o anterior, apenas o resultado anterior é reavaliado.
+        
+        Args:
+            texto: Texto procurado (sem distinção de maiúsculas e minúsculas)
+        """
+        texto = texto.strip().lower()
+        if texto == self._filtro:
+            return
+        self._cancelar_filtro()
+        self._inicio = 0
+
+        if not texto:
+            self._filtro = ""
+            self._indices = None
+            self._filtro_completo = True
+            self._renderizar()
+            return
+
+        if self._filtro and texto.startswith(self._filtro) and self._filtro_completo:
+            base = self._indices if self._indices is not None else range(len(self._linhas))
+        else:
+            base = range(len(self._linhas))
+        chaves = self._chaves_busca
+
+        resultado = []
+        self._filtro = texto
+        self._filtro_completo = False
+        self._indices = resultado
+
+        def processar_lote(posicao):
+            fim = min(posicao + TAMANHO_LOTE_FILTRO, len(base))
+            if isinstance(base, range):
+                self._montar_chaves_busca(fim)
+            resultado.extend(i for i in base[posicao:fim] if texto in chaves[i])
+            if fim < len(base):
+                self._job_filtro = self.after(1, processar_lote, fim)
+            else:
+                self._job_filtro = None
+                self._filtro_completo = True
+            self._renderizar()
+
+        processar_lote(0)
+
+    def _montar_chaves_busca(self, fim):
+        """
+        Monta o texto pesquisável das linhas ainda sem chave, até a posição fim
+        
+        As chaves são montadas lote a lote, junto com a busca, para não bloquear a
+        interface na primeira consulta. Um filtro que só reavalia o resultado
+        anterior parte de uma busca completa, quando todas as chaves já existem.
+        """
+        chaves = self._chaves_busca
+        for linha in self._linhas[len(chaves):fim]:
+            chaves.append("\x00".join(str(linha[indice] or "") for indice in self._indices_filtro).lower())
+
+    def _cancelar_filtro(self):
+        """Interrompe um filtro em andamento"""
+        if self._job_filtro is not None:
+            self.after_cancel(self._job_filtro)
+            self._job_filtro = None
+
+    def _renderizar(self):
+        """Recria os itens do Treeview para a janela visível e atualiza a barra de rolagem"""
+        total = self.total_visivel
+        self._inicio = max(0, min(self._inicio, total - self._altura))
+        fim = min(self._inicio + self._altura, total)
+
+        self.tree.delete(*self.tree.get_children())
+        for posicao in range(self._inicio, fim):
+            indice = posicao if self._indices is None else self._indices[posicao]
+            linha = self._linhas[indice]
+            self.tree.insert("", "end", values=[_formatar_celula(valor) for valor in linha])
+
+        if total:
+            self.scrollbar.set(self._inicio / total, fim / total)
+        else:
+            self.scrollbar.set(0, 1)
+
+        if self.ao_atualizar is not None:
+            self.ao_atualizar(total, len(self._linhas))
+
+    def _rolar(self, linhas):
+        """Desloca a janela visível pela quantidade de linhas informada"""
+        self._inicio += linhas
+        self._renderizar()
+        return "break"
+
+    def _rolar_barra(self, acao, valor, unidade=None):
+        """Trata os comandos da barra de rolagem ('moveto' e 'scroll')"""
+        if acao == "moveto":
+            self._inicio = int(float(valor) * self.total_visivel)
+            self._renderizar()
+        elif acao == "scroll":
+            passo = self._altura if unidade == "pages" else 1
+            self._rolar(int(valor) * passo)
+
+    def _ao_redimensionar(self, evento):
+        """Recalcula quantas linhas cabem na área visível"""
+        altura_linha = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        altura = max(1, (evento.height - 25) // altura_linha)
+        if altura != self._altura:
+            self._altura = altura
+            self._renderizar()
+
+
+def _formatar_celula(valor):
+    """Formata um valor para exibição na grade"""
+    if valor is None:
+        return ""
+    if isinstance(valor, date):
+        return valor.strftime("%d/%m/%Y")
+    if isinstance(valor, float):
+        return f"{valor:.4f}".rstrip("0").rstrip(".")
+    return str(valor)
+
+
 def _criar_barra_status(root, ui_elements):
     """
     Cria a barra de status na parte inferior da janela
@@ -0,0 +1,83 @@
+"""
+Fixtures compartilhadas pelos testes
+"""
+import copy
+
+import pytest
+
+import xml_parser
+from config.config import config
+
+
+MODELO_NFE = """<?xml version="1.0" encoding="UTF-8"?>
+<nfeProc xmlns="http://www.portalfiscal.inf.br/nfe" versao="4.00"><NFe><infNFe Id="NFe{chave}" versao="4.00">
+<ide><nNF>{numero}</nNF><dhEmi>{emissao}T10:00:00-03:00</dhEmi></ide>
+<emit><CNPJ>07131690000167</CNPJ><xNome>{fornecedor}</xNome></emit>
+{itens}
+<total><ICMSTot><vBC>25.00</vBC><vICMS>4.50</vICMS><vNF>25.00</vNF></ICMSTot></total>
+</infNFe></NFe></nfeProc>
+"""
+
+MODELO_ITEM = (
+    '<det nItem="{n}"><prod><xProd>{descricao}</xProd><NCM>{ncm}</NCM><CFOP>5102</CFOP>'
+    '<qCom>10.0000</qCom><vUnCom>1.50</vUnCom><vProd>15.00</vProd></prod></det>'
+)
+
+MODELO_CANCELAMENTO = """<?xml version="1.0" encoding="UTF-8"?>
+<procEventoNFe xmlns="http://www.portalfiscal.inf.br/nfe" versao="1.00"><evento versao="1.00"><infEvento Id="ID110111{chave}01"><tpEvento>110111</tpEvento><chNFe>{chave}</chNFe></infEvento></evento><retEvento versao="1.00"><infEvento><cStat>{status}</cStat></infEvento></retEvento></procEventoNFe>
+"""
+
+
+@pytest.fixture(autouse=True)
+def configuracao_padrao(tmp_path, monkeypatch):
+    """Isola os testes do config.json do desenvolvedor, usando as configurações padrão"""
+    monkeypatch.setattr(config, "_config", copy.deepcopy(config.DEFAULT_CONFIG))
+    monkeypatch.setattr(config, "CONFIG_FILE", tmp_path / "config.json")
+    monkeypatch.setattr(xml_parser, "_plano_padrao", None)
+
+
+def montar_chave(numero, ano_mes="2501", modelo="55"):
+    """Monta uma chave de acesso de 44 dígitos com o mês (AAMM), o modelo e o número informados"""
+    return f"35{ano_mes}07131690000167{modelo}001{int(numero):09d}1{int(numero):08d}0"
+
+
+@pytest.fixture
+def criar_nfe(tmp_path):
+    """
+    Cria arquivos de NF-e de teste
+    
+    Returns:
+        Função (numero, itens=("Parafuso",), emissao="2025-01-15", fornecedor="Fornecedor X")
+        que grava o XML e retorna (caminho, chave de acesso)
+    """
+    def criar(numero, itens=("Parafuso",), emissao="2025-01-15", fornecedor="Fornecedor X"):
+        chave = montar_chave(numero, ano_mes=emissao[2:4] + emissao[5:7])
+        conteudo = MODELO_NFE.format(
+            chave=chave,
+            numero=numero,
+            emissao=emissao,
+            fornecedor=fornecedor,
+            itens="\n".join(
+                MODELO_ITEM.format(n=n, descricao=descricao, ncm="07131500")
+                for n, descricao in enumerate(itens, start=1)
+            ),
+        )
+        caminho = tmp_path / f"nfe_{numero}.xml"
+        caminho.write_text(conteudo, encoding="utf-8")
+        return caminho, chave
+    return criar
+
+
+@pytest.fixture
+def criar_cancelamento(tmp_path):
+    """
+    Cria arquivos de evento de cancelamento de teste
+    
+    Returns:
+        Função (chave, status="135") que grava o XML e retorna o caminho
+    """
+    def criar(chave, status="135"):
+        caminho = tmp_path / f"canc_{chave[-8:]}_{status}.xml"
+        caminho.write_text(MODELO_CANCELAMENTO.format(chave=chave, status=status), encoding="utf-8")
+        return caminho
+    return criar
@@ -0,0 +1,182 @@
+"""
+Testes do cache de planilhas usado pela interface gráfica
+"""
+import os
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import excel_export
+from excel_export import CachePlanilhas, exportar_linhas_streaming, ler_planilha_streaming
+from xml_parser import COLUNA_CHAVE
+
+
+COLUNAS = ["Número da Nota", "Descrição do Produto", COLUNA_CHAVE]
+
+
+class ThreadSincrona:
+    """Substitui threading.Thread executando o alvo imediatamente, para testes determinísticos"""
+    
+    def __init__(self, target, args=(), daemon=None):
+        self.target = target
+        self.args = args
+    
+    def start(self):
+        self.target(*self.args)
+
+
+@pytest.fixture
+def falhas_notificadas():
+    return []
+
+
+@pytest.fixture
+def cache(monkeypatch, falhas_notificadas):
+    monkeypatch.setattr(excel_export, "threading", SimpleNamespace(
+        RLock=threading.RLock, Lock=threading.Lock, Timer=threading.Timer, Thread=ThreadSincrona
+    ))
+    cache = CachePlanilhas(atraso_ocioso=3600, intervalo_maximo=3600, ao_falhar=falhas_notificadas.extend)
+    yield cache
+    if cache._timer is not None:
+        cache._timer.cancel()
+
+
+@pytest.fixture
+def gravacao_bloqueada(monkeypatch):
+    """Faz as gravações falharem como se a planilha estivesse aberta no Excel"""
+    gravar = excel_export._gravar_alteracoes_streaming
+    
+    def falhar(*args):
+        raise PermissionError("planilha aberta")
+    monkeypatch.setattr(excel_export, "_gravar_alteracoes_streaming", falhar)
+    return lambda: monkeypatch.setattr(excel_export, "_gravar_alteracoes_streaming", gravar)
+
+
+def linha(numero, descricao, chave=None):
+    return {"Número da Nota": str(numero), "Descrição do Produto": descricao,
+            COLUNA_CHAVE: chave or f"chave-{numero}"}
+
+
+def ler(caminho):
+    return [(l["Número da Nota"], l["Descrição do Produto"]) for l in ler_planilha_streaming(caminho)[1]]
+
+
+def alterar_externamente(caminho, linhas):
+    """Regrava a planilha como outro programa faria, garantindo uma nova data de modificação"""
+    mtime = os.stat(caminho).st_mtime_ns
+    exportar_linhas_streaming(linhas, caminho, COLUNAS)
+    os.utime(caminho, ns=(mtime + 10**9, mtime + 10**9))
+
+
+def test_importacao_acumula_em_memoria_ate_descarregar(tmp_path, cache):
+    caminho = tmp_path / "Janeiro.xlsx"
+    exportar_linhas_streaming([linha(1, "Parafuso")], caminho, COLUNAS)
+    
+    assert cache.adicionar(caminho, [linha(1, "Parafuso"), linha(2, "Porca")]) == 1
+    assert cache.adicionar(caminho, [linha(2, "Porca"), linha(3, "Arruela")]) == 1
+    assert cache.pendentes() == [str(caminho)]
+    assert ler(caminho) == [("1", "Parafuso")]
+    
+    assert cache.descarregar() == []
+    
+    assert cache.pendentes() == []
+    assert ler(caminho) == [("1", "Parafuso"), ("2", "Porca"), ("3", "Arruela")]
+
+
+def test_alteracao_externa_reaplica_pendencias(tmp_path, cache):
+    caminho = tmp_path / "Janeiro.xlsx"
+    exportar_linhas_streaming([linha(1, "Parafuso"), linha(2, "Porca")], caminho, COLUNAS)
+    cache.adicionar(caminho, [linha(3, "Arruela"), linha(4, "Rebite")])
+    cache.cancelar(caminho, {"chave-2"})
+    
+    # Outro programa acrescenta a nota 4 e uma nota 5, mantendo a nota cancelada
+    alterar_externamente(caminho, [linha(2, "Porca"), linha(4, "Rebite"), linha(5, "Bucha")])
+    assert cache.adicionar(caminho, [linha(5, "Bucha"), linha(6, "Pino")]) == 1
+    
+    assert cache.descarregar() == []
+    assert ler(caminho) == [("4", "Rebite"), ("5", "Bucha"), ("3", "Arruela"), ("6", "Pino")]
+
+
+def test_falha_na_gravacao_mantem_pendencias(tmp_path, cache, gravacao_bloqueada):
+    caminho = tmp_path / "Janeiro.xlsx"
+    exportar_linhas_streaming([linha(1, "Parafuso"), linha(2, "Porca")], caminho, COLUNAS)
+    cache.adicionar(caminho, [linha(3, "Arruela")])
+    cache.cancelar(caminho, {"chave-1"})
+    
+    assert cache.descarregar() == [(str(caminho), "planilha aberta")]
+    assert cache.pendentes() == [str(caminho)]
+    assert ler(caminho) == [("1", "Parafuso"), ("2", "Porca")]
+    
+    gravacao_bloqueada()
+    assert cache.descarregar() == []
+    assert cache.pendentes() == []
+    assert ler(caminho) == [("2", "Porca"), ("3", "Arruela")]
+
+
+def test_planilhas_pendentes_nao_sao_removidas_do_cache(tmp_path, cache, gravacao_bloqueada,
+                                                        falhas_notificadas):
+    janeiro, fevereiro = tmp_path / "Janeiro.xlsx", tmp_path / "Fevereiro.xlsx"
+    cache.limite_memoria = 1
+    
+    cache.adicionar(janeiro, [linha(1, "Parafuso")])
+    # A troca de planilha dispara a gravação em segundo plano, que falha
+    cache.adicionar(fevereiro, [linha(2, "Porca")])
+    cache.adicionar(fevereiro, [linha(3, "Arruela")])
+    
+    assert sorted(cache.pendentes()) == [str(fevereiro), str(janeiro)]
+    assert sorted(falhas_notificadas) == [(str(fevereiro), "planilha aberta"), (str(janeiro), "planilha aberta")]
+    
+    gravacao_bloqueada()
+    assert cache.descarregar() == []
+    
+    # Gravadas, as planilhas deixam a memória, exceto a que está em uso
+    assert list(cache._entradas) == [fevereiro]
+    assert ler(janeiro) == [("1", "Parafuso")]
+    assert ler(fevereiro) == [("2", "Porca"), ("3", "Arruela")]
+
+
+def test_alteracoes_durante_a_gravacao_continuam_pendentes(tmp_path, cache, monkeypatch):
+    caminho = tmp_path / "Janeiro.xlsx"
+    gravar = excel_export._gravar_alteracoes_streaming
+    
+    def gravar_com_importacao_concorrente(*args):
+        cache.adicionar(caminho, [linha(2, "Porca")])
+        gravar(*args)
+    monkeypatch.setattr(excel_export, "_gravar_alteracoes_streaming", gravar_com_importacao_concorrente)
+    cache.adicionar(caminho, [linha(1, "Parafuso")])
+    
+    assert cache.descarregar() == []
+    
+    assert ler(caminho) == [("1", "Parafuso")]
+    assert cache.pendentes() == [str(caminho)]
+    assert cache.adicionar(caminho, [linha(2, "Porca")]) == 0
+
+
+def test_gravacao_do_cache_aguarda_o_fim_do_lote(tmp_path, cache, monkeypatch):
+    monkeypatch.setattr(excel_export, "OUTPUT_DIR", tmp_path)
+    caminho = tmp_path / "Janeiro.xlsx"
+    exportar_linhas_streaming([linha(1, "A")], caminho, COLUNAS)
+    resultados = []
+    
+    def importar_arquivo_unico():
+        resultados.append(cache.adicionar(caminho, [linha(3, "C"), linha(2, "B")]))
+        resultados.append(cache.descarregar())
+    importacao = threading.Thread(target=importar_arquivo_unico)
+    
+    def documentos():
+        yield {"dados": [linha(2, "B")], "data_emissao": "15/01/2025", "chaves_canceladas": []}
+        importacao.start()
+        importacao.join(timeout=0.5)
+        # A importação é aceita em memória, mas sua gravação espera o lote
+        assert resultados == [2] and importacao.is_alive()
+        yield {"dados": [linha(4, "D")], "data_emissao": "15/01/2025", "chaves_canceladas": []}
+    
+    with cache.gravacao_exclusiva() as falhas:
+        assert falhas == []
+        excel_export.exportar_documentos(documentos())
+    importacao.join()
+    
+    assert resultados == [2, []]
+    assert cache.pendentes() == []
+    assert ler(caminho) == [("1", "A"), ("2", "B"), ("4", "D"), ("3", "C")]
@@ -0,0 +1,136 @@
+"""
+Testes da gravação das planilhas
+"""
+from datetime import date
+
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+
+import excel_export
+from config.config import config
+from excel_export import (FORMATO_DATA_EXCEL, _ler_planilha, _salvar_planilha, exportar_documentos,
+                          exportar_linhas_streaming, ler_planilha_streaming, processar_multiplos_xmls)
+from xml_parser import COLUNA_CHAVE, extrair_documento
+
+
+def test_planilha_pandas_formata_datas_e_preserva_textos(tmp_path):
+    caminho = tmp_path / "Janeiro.xlsx"
+    chave = "35250107131690000167550010000301901011214752"
+    df = pd.DataFrame([{"Data de Emissão": date(2025, 1, 15), "NCM": "07131500", COLUNA_CHAVE: chave}])
+    
+    _salvar_planilha(df, caminho)
+    
+    celula = load_workbook(caminho).active["A2"]
+    assert celula.is_date and celula.number_format == FORMATO_DATA_EXCEL
+    lido = _ler_planilha(caminho)
+    assert lido.loc[0, "NCM"] == "07131500"
+    assert lido.loc[0, COLUNA_CHAVE] == chave
+
+
+def test_exportacao_streaming_consome_iterador_e_formata_datas(tmp_path):
+    caminho = tmp_path / "Janeiro.xlsx"
+    linhas = ({"Data": date(2025, 1, day), "Valor": day * 1.5} for day in range(1, 4))
+    
+    exportar_linhas_streaming(linhas, caminho, ["Data", "Valor", "Vazia"])
+    
+    colunas, lidas = ler_planilha_streaming(caminho)
+    assert colunas == ["Data", "Valor", "Vazia"]
+    assert [(linha["Data"].day, linha["Valor"], linha.get("Vazia")) for linha in lidas] == [
+        (1, 1.5, None), (2, 3.0, None), (3, 4.5, None)
+    ]
+    assert load_workbook(caminho).active["A2"].number_format == FORMATO_DATA_EXCEL
+
+
+def test_falha_ao_salvar_preserva_planilha_existente(tmp_path, monkeypatch):
+    caminho = tmp_path / "Janeiro.xlsx"
+    exportar_linhas_streaming([{"Valor": 1}], caminho, ["Valor"])
+    
+    def falhar(*args):
+        raise PermissionError("planilha aberta no Excel")
+    monkeypatch.setattr(excel_export.os, "replace", falhar)
+    
+    with pytest.raises(PermissionError):
+        exportar_linhas_streaming([{"Valor": 2}], caminho, ["Valor"])
+    
+    assert [linha["Valor"] for linha in ler_planilha_streaming(caminho)[1]] == [1]
+    assert list(tmp_path.iterdir()) == [caminho]
+
+
+@pytest.mark.parametrize("streaming", [True, False])
+def test_lote_acrescenta_sem_duplicatas_e_aplica_cancelamentos(tmp_path, monkeypatch, criar_nfe,
+                                                               criar_cancelamento, streaming):
+    saida = tmp_path / "planilhas"
+    monkeypatch.setattr(excel_export, "OUTPUT_DIR", saida)
+    monkeypatch.setitem(config._config, "exportacao_streaming", streaming)
+    caminho_1, chave_1 = criar_nfe(30190, itens=("Parafuso", "Porca"))
+    criar_nfe(30191, itens=("Arruela",))
+    criar_nfe(30192, itens=("Rebite",), emissao="2025-02-03")
+    excel_export.gerar_planilha(caminho_1)
+    criar_cancelamento(chave_1)
+    
+    planilhas = processar_multiplos_xmls(tmp_path)
+    
+    assert sorted(planilhas) == [str(saida / "Fevereiro.xlsx"), str(saida / "Janeiro.xlsx")]
+    janeiro = list(ler_planilha_streaming(saida / "Janeiro.xlsx")[1])
+    assert [linha["Descrição do Produto"] for linha in janeiro] == ["Arruela"]
+    assert janeiro[0]["NCM"] == "07131500"
+    fevereiro = list(ler_planilha_streaming(saida / "Fevereiro.xlsx")[1])
+    assert [linha["Descrição do Produto"] for linha in fevereiro] == ["Rebite"]
+
+
+def test_lote_streaming_regrava_mes_que_so_recebe_cancelamentos(tmp_path, monkeypatch, criar_nfe,
+                                                                criar_cancelamento):
+    saida = tmp_path / "planilhas"
+    monkeypatch.setattr(excel_export, "OUTPUT_DIR", saida)
+    caminho, chave = criar_nfe(30190)
+    excel_export.gerar_planilha(caminho)
+    caminho.unlink()
+    criar_cancelamento(chave)
+    
+    planilhas = processar_multiplos_xmls(tmp_path)
+    
+    assert planilhas == [str(saida / "Janeiro.xlsx")]
+    assert list(ler_planilha_streaming(saida / "Janeiro.xlsx")[1]) == []
+
+
+def test_exportar_documentos_ja_extraidos(tmp_path, monkeypatch, criar_nfe):
+    saida = tmp_path / "planilhas"
+    monkeypatch.setattr(excel_export, "OUTPUT_DIR", saida)
+    documentos = [extrair_documento(criar_nfe(numero, itens=(produto,))[0])
+                  for numero, produto in ((30190, "Parafuso"), (30191, "Porca"), (30190, "Parafuso"))]
+    cancelada = documentos[1]["dados"][0][COLUNA_CHAVE]
+    # As linhas podem ser consumidas sob demanda
+    documentos = [dict(documento, dados=iter(documento["dados"])) for documento in documentos]
+    
+    planilhas = exportar_documentos(documentos, [cancelada])
+    
+    assert planilhas == [str(saida / "Janeiro.xlsx")]
+    assert [linha["Descrição do Produto"] for linha in ler_planilha_streaming(saida / "Janeiro.xlsx")[1]] == [
+        "Parafuso"
+    ]
+
+
+@pytest.mark.parametrize("streaming", [True, False])
+def test_linhas_de_planilhas_antigas_recebem_os_tipos_configurados(tmp_path, monkeypatch, criar_nfe, streaming):
+    saida = tmp_path / "planilhas"
+    saida.mkdir()
+    monkeypatch.setattr(excel_export, "OUTPUT_DIR", saida)
+    monkeypatch.setitem(config._config, "exportacao_streaming", streaming)
+    # Versões anteriores gravavam datas e valores como texto
+    exportar_linhas_streaming(
+        [{"Data de Emissão": "10/01/2025", "Número da Nota": 100, "Descrição do Produto": "Porca",
+          "Valor do Item": "15.00", "Quantidade": "2"}],
+        saida / "Janeiro.xlsx",
+        ["Data de Emissão", "Número da Nota", "Descrição do Produto", "Valor do Item", "Quantidade"]
+    )
+    criar_nfe(30190)
+    
+    processar_multiplos_xmls(tmp_path)
+    
+    antiga, nova = ler_planilha_streaming(saida / "Janeiro.xlsx")[1]
+    assert (antiga["Data de Emissão"].date(), antiga["Valor do Item"], antiga["Quantidade"]) == (
+        date(2025, 1, 10), 15.0, 2.0
+    )
+    assert antiga["Número da Nota"] == "100"
+    assert nova["Data de Emissão"].date() == date(2025, 1, 15)
@@ -0,0 +1,174 @@
+"""
+Testes da extração de dados dos XMLs
+"""
+from datetime import date
+
+import pytest
+
+import excel_export
+from conftest import montar_chave
+from xml_parser import (COLUNA_CHAVE, EXTRATORES, PlanoExtracao, converter_valor, extrair_documento,
+                        identificar_documento)
+
+
+CAMPOS = [
+    {"coluna": "Emissão", "caminho": "ide/dhEmi", "tipo": "data", "escopo": "documento"},
+    {"coluna": "Número", "caminho": "ide/nNF", "tipo": "texto", "escopo": "documento"},
+    {"coluna": "Item", "caminho": "@nItem", "tipo": "inteiro", "escopo": "item"},
+    {"coluna": "Produto", "caminho": "prod/xProd", "tipo": "texto", "escopo": "item"},
+    {"coluna": "Valor", "caminho": "prod/vProd", "tipo": "decimal", "escopo": "item"},
+    {"coluna": "Pedido", "caminho": "prod/xPed", "tipo": "texto", "escopo": "item"},
+]
+
+INF_NFE = {
+    "ide": {"nNF": "30190", "dhEmi": "2025-01-15T10:00:00-03:00"},
+    "det": [
+        {"@nItem": "1", "prod": {"xProd": "Parafuso", "vProd": "15.00"}},
+        {"@nItem": "2", "prod": {"xProd": "Porca", "vProd": "10.00"}},
+    ],
+}
+
+
+def test_plano_agrupa_caminhos_com_prefixo_comum():
+    plano = PlanoExtracao(CAMPOS)
+    
+    assert plano.colunas == [campo["coluna"] for campo in CAMPOS]
+    assert set(plano.documento) == {"ide"}
+    assert set(plano.documento["ide"]) == {"dhEmi", "nNF"}
+    assert set(plano.item["prod"]) == {"xProd", "vProd", "xPed"}
+    assert plano.item["prod"]["xProd"][None] == [("Produto", "texto")]
+
+
+def test_plano_gera_uma_linha_por_item_com_tipos_convertidos():
+    linhas = PlanoExtracao(CAMPOS).extrair(INF_NFE)
+    
+    assert linhas == [
+        {"Emissão": date(2025, 1, 15), "Número": "30190", "Item": 1,
+         "Produto": "Parafuso", "Valor": 15.0, "Pedido": None},
+        {"Emissão": date(2025, 1, 15), "Número": "30190", "Item": 2,
+         "Produto": "Porca", "Valor": 10.0, "Pedido": None},
+    ]
+    assert list(linhas[0]) == [campo["coluna"] for campo in CAMPOS]
+
+
+def test_plano_aceita_item_unico():
+    inf_nfe = dict(INF_NFE, det=INF_NFE["det"][0])
+    
+    linhas = PlanoExtracao(CAMPOS).extrair(inf_nfe)
+    
+    assert [linha["Produto"] for linha in linhas] == ["Parafuso"]
+
+
+@pytest.mark.parametrize("campo", [
+    {"coluna": "X", "caminho": "ide/nNF", "tipo": "moeda"},
+    {"coluna": "X", "caminho": "ide/nNF", "escopo": "nota"},
+    {"coluna": "X", "caminho": "/"},
+])
+def test_plano_rejeita_campo_invalido(campo):
+    with pytest.raises(ValueError):
+        PlanoExtracao([campo])
+
+
+def test_converter_valor_mantem_texto_original_em_caso_de_erro():
+    assert converter_valor("1,5", "decimal") == "1,5"
+    assert converter_valor(None, "inteiro") is None
+    assert converter_valor(" 0713 ", "texto") == "0713"
+
+
+def test_extrair_documento_inclui_chave_de_acesso(criar_nfe):
+    caminho, chave = criar_nfe(30190, itens=("Parafuso", "Porca"))
+    
+    documento = extrair_documento(caminho)
+    
+    assert documento["tipo"] == "NF-e"
+    assert documento["data_emissao"] == "15/01/2025"
+    assert [linha[COLUNA_CHAVE] for linha in documento["dados"]] == [chave, chave]
+    assert [linha["Descrição do Produto"] for linha in documento["dados"]] == ["Parafuso", "Porca"]
+
+
+def test_identificar_documento_pelo_cabecalho(tmp_path, criar_nfe, criar_cancelamento):
+    caminho_nfe, chave = criar_nfe(30190)
+    caminho_nfce = tmp_path / "nfce.xml"
+    caminho_nfce.write_text(caminho_nfe.read_text(encoding="utf-8").replace(chave, chave[:20] + "65" + chave[22:]),
+                            encoding="utf-8")
+    caminho_cte = tmp_path / "cte.xml"
+    caminho_cte.write_text('<?xml version="1.0"?><!-- cte --><cteProc versao="3.00"><CTe/></cteProc>', encoding="utf-8")
+    caminho_cce = tmp_path / "cce.xml"
+    caminho_cce.write_text(criar_cancelamento(chave).read_text(encoding="utf-8").replace("110111", "110110"),
+                           encoding="utf-8")
+    
+    assert identificar_documento(caminho_nfe) == {"tipo": "NF-e", "raiz": "nfeProc", "versao": "4.00"}
+    assert identificar_documento(caminho_nfce)["tipo"] == "NFC-e"
+    assert identificar_documento(caminho_cte) == {"tipo": "CT-e", "raiz": "cteProc", "versao": "3.00"}
+    assert identificar_documento(criar_cancelamento(chave))["tipo"] == "Cancelamento NF-e"
+    assert identificar_documento(caminho_cce)["tipo"] == "Evento NF-e 110110"
+
+
+def test_identificar_documento_sem_protocolo_usa_versao_de_infnfe(tmp_path, criar_nfe):
+    caminho_nfe, _ = criar_nfe(30190)
+    conteudo = caminho_nfe.read_text(encoding="utf-8")
+    caminho = tmp_path / "nfe_sem_protocolo.xml"
+    caminho.write_text(
+        conteudo.replace('<nfeProc xmlns="http://www.portalfiscal.inf.br/nfe" versao="4.00"><NFe>',
+                         '<NFe xmlns="http://www.portalfiscal.inf.br/nfe">').replace("</nfeProc>", ""),
+        encoding="utf-8"
+    )
+    
+    assert identificar_documento(caminho) == {"tipo": "NF-e", "raiz": "NFe", "versao": "4.00"}
+    assert len(extrair_documento(caminho)["dados"]) == 1
+
+
+def test_documento_sem_extrator_registrado_e_ignorado(tmp_path):
+    caminho = tmp_path / "cte.xml"
+    caminho.write_text('<?xml version="1.0"?><cteProc versao="3.00"><CTe/></cteProc>', encoding="utf-8")
+    
+    assert "CT-e" not in EXTRATORES
+    assert extrair_documento(caminho) is None
+
+
+@pytest.mark.parametrize("status, canceladas", [("135", 1), ("155", 1), ("573", 0)])
+def test_cancelamento_so_vale_quando_registrado(criar_cancelamento, status, canceladas):
+    chave = montar_chave(30190)
+    
+    documento = extrair_documento(criar_cancelamento(chave, status=status))
+    
+    if canceladas:
+        assert documento["chaves_canceladas"] == [chave]
+    else:
+        assert documento is None
+
+
+def test_remover_notas_canceladas_pelo_mes_da_chave(tmp_path, monkeypatch, criar_nfe):
+    monkeypatch.setattr(excel_export, "OUTPUT_DIR", tmp_path / "planilhas")
+    caminho_1, chave_1 = criar_nfe(30190, itens=("Parafuso", "Porca"))
+    caminho_2, _ = criar_nfe(30191, itens=("Arruela",))
+    excel_export.gerar_planilha(caminho_1)
+    excel_export.gerar_planilha(caminho_2)
+    
+    alteradas = excel_export.remover_notas_canceladas([chave_1])
+    
+    assert alteradas == [str(tmp_path / "planilhas" / "Janeiro.xlsx")]
+    df = excel_export._ler_planilha(tmp_path / "planilhas" / "Janeiro.xlsx")
+    assert list(df["Descrição do Produto"]) == ["Arruela"]
+
+
+def test_nota_importada_depois_do_cancelamento_e_descartada(tmp_path, monkeypatch, criar_nfe, criar_cancelamento):
+    saida = tmp_path / "planilhas"
+    monkeypatch.setattr(excel_export, "OUTPUT_DIR", saida)
+    caminho_1, chave_1 = criar_nfe(30190, itens=("Parafuso",))
+    caminho_2, chave_2 = criar_nfe(30191, itens=("Porca",))
+    caminho_3, _ = criar_nfe(30192, itens=("Arruela",))
+    
+    excel_export.gerar_planilha(criar_cancelamento(chave_1))
+    excel_export.remover_notas_canceladas([chave_2])
+    
+    assert excel_export.gerar_planilha(caminho_1) is None
+    cache = excel_export.CachePlanilhas(atraso_ocioso=3600)
+    assert excel_export.gerar_planilha(caminho_2, cache=cache) is None
+    assert cache.pendentes() == []
+    excel_export.gerar_planilha(caminho_3)
+    excel_export.exportar_documentos([extrair_documento(caminho_1), extrair_documento(caminho_2)])
+    
+    assert excel_export.ler_chaves_canceladas() == {chave_1, chave_2}
+    df = excel_export._ler_planilha(saida / "Janeiro.xlsx")
+    assert list(df["Descrição do Produto"]) == ["Arruela"]
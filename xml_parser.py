@@ -1,10 +1,13 @@
 import json
-from datetime import datetime
+import re
+from datetime import date, datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Union
+from typing import Callable, Dict, List, Optional, Tuple, Union
 
 import xmltodict
 
+from config.config import config
+
 ROOT_DIR = Path(__file__).parent.resolve()
 
 def ler_arquivo_xml(caminho_arquivo: Union[str, Path]) -> Optional[Dict]:
@@ -51,53 +54,345 @@ def formatar_data(data_iso: str) -> str:
         print(f"Erro ao formatar data: {e}")
         return data_iso  # Retorna a data original em caso de erro
 
-def extrair_dados_xml(caminho_xml: Union[str, Path]) -> Tuple[List[Dict], Optional[str]]:
+TIPOS_CAMPO = ("texto", "inteiro", "decimal", "data")
+ESCOPOS_CAMPO = ("documento", "item")
+
+def converter_valor(valor: Optional[str], tipo: str) -> Union[str, int, float, date, None]:
     """
-    Extrai os dados relevantes do XML para uma lista de dicionários
+    Converte o texto de um campo do XML para o tipo declarado na especificação
+    
+    Datas são aceitas no formato do XML (AAAA-MM-DD) e no dd/MM/aaaa gravado
+    como texto nas planilhas de versões anteriores.
+    
+    Args:
+        valor: Texto extraído do XML
+        tipo: Um dos tipos em TIPOS_CAMPO ("texto", "inteiro", "decimal", "data")
+        
+    Returns:
+        Valor convertido, ou o texto original em caso de erro
+    """
+    if valor is None:
+        return None
+    try:
+        if tipo == "inteiro":
+            return int(valor)
+        if tipo == "decimal":
+            return float(valor)
+        if tipo == "data":
+            texto = valor.split('T')[0]
+            return datetime.strptime(texto, '%d/%m/%Y' if '/' in texto else '%Y-%m-%d').date()
+        return str(valor).strip()
+    except Exception as e:
+        print(f"Erro ao converter '{valor}' para {tipo}: {e}")
+        return valor
+
+class PlanoExtracao:
+    """
+    Plano de extração compilado a partir da especificação de campos.
+    
+    Os caminhos de cada escopo são agrupados em uma árvore de prefixos, de modo
+    que cada ramo do XML é visitado uma única vez, independentemente da
+    quantidade de colunas que compartilham o mesmo prefixo. A chave None de
+    cada nó guarda os campos (coluna, tipo) que terminam naquele ponto.
+    """
+    
+    def __init__(self, campos: List[Dict]):
+        """
+        Compila a especificação de campos
+        
+        Args:
+            campos: Lista de dicionários com "coluna", "caminho", "tipo" e "escopo"
+            
+        Raises:
+            ValueError: Se algum campo tiver tipo, escopo ou caminho inválido
+        """
+        self.colunas = []
+        self.documento = {}
+        self.item = {}
+        
+        for campo in campos:
+            coluna = campo["coluna"]
+            tipo = campo.get("tipo", "texto")
+            escopo = campo.get("escopo", "documento")
+            partes = [parte for parte in campo["caminho"].split('/') if parte]
+            
+            if tipo not in TIPOS_CAMPO:
+                raise ValueError(f"Tipo inválido para o campo '{coluna}': {tipo}")
+            if escopo not in ESCOPOS_CAMPO:
+                raise ValueError(f"Escopo inválido para o campo '{coluna}': {escopo}")
+            if not partes:
+                raise ValueError(f"Caminho vazio para o campo '{coluna}'")
+            
+            no = self.documento if escopo == "documento" else self.item
+            for parte in partes:
+                no = no.setdefault(parte, {})
+            no.setdefault(None, []).append((coluna, tipo))
+            self.colunas.append(coluna)
+    
+    def extrair(self, inf_nfe: Dict) -> List[Dict]:
+        """
+        Aplica o plano ao elemento infNFe, gerando uma linha por item da nota
+        
+        Args:
+            inf_nfe: Dicionário do elemento infNFe
+            
+        Returns:
+            Lista de dicionários, com as colunas na ordem da especificação
+        """
+        valores_documento = {}
+        _aplicar_no(self.documento, inf_nfe, valores_documento)
+        
+        itens = inf_nfe.get("det") or []
+        if isinstance(itens, dict):
+            itens = [itens]
+        
+        linhas = []
+        for item in itens:
+            valores = dict(valores_documento)
+            _aplicar_no(self.item, item, valores)
+            linhas.append({coluna: valores.get(coluna) for coluna in self.colunas})
+        return linhas
+
+def _aplicar_no(no_plano: Dict, no_xml, destino: Dict) -> None:
+    """
+    Percorre simultaneamente um nó do plano e o nó correspondente do XML
+    
+    Args:
+        no_plano: Nó da árvore de prefixos do plano
+        no_xml: Nó correspondente do dicionário gerado pelo xmltodict
+        destino: Dicionário que recebe os valores convertidos
+    """
+    if isinstance(no_xml, list):
+        # Elementos repetidos fora do escopo de item: considera a primeira ocorrência
+        no_xml = no_xml[0] if no_xml else None
+    if no_xml is None:
+        return
+    
+    for chave, filho in no_plano.items():
+        if chave is None:
+            valor = no_xml.get("#text") if isinstance(no_xml, dict) else no_xml
+            for coluna, tipo in filho:
+                destino[coluna] = converter_valor(valor, tipo)
+        elif isinstance(no_xml, dict):
+            _aplicar_no(filho, no_xml.get(chave), destino)
+
+_plano_padrao: Optional[PlanoExtracao] = None
+
+def obter_plano_extracao() -> PlanoExtracao:
+    """
+    Retorna o plano de extração compilado a partir da configuração
+    
+    O plano é compilado na primeira chamada e reutilizado nas seguintes.
+    
+    Returns:
+        Plano de extração dos campos configurados
+    """
+    global _plano_padrao
+    if _plano_padrao is None:
+        _plano_padrao = PlanoExtracao(config.campos)
+    return _plano_padrao
+
+# Quantidade de bytes lidos do início do arquivo para identificar o documento
+TAMANHO_CABECALHO = 4096
+
+# Coluna com a chave de acesso, usada para localizar as linhas de notas canceladas
+COLUNA_CHAVE = "Chave de Acesso"
+
+# Código do evento de cancelamento de NF-e/NFC-e
+EVENTO_CANCELAMENTO = "110111"
+
+_RE_RAIZ = re.compile(rb'<(?![?!])(?:[\w.-]+:)?([\w.-]+)([^>]*)>')
+_RE_VERSAO = re.compile(rb'\bversao\s*=\s*["\']([^"\']+)["\']')
+_RE_CHAVE_NFE = re.compile(rb'\bId\s*=\s*["\']NFe(\d{44})["\']')
+_RE_VERSAO_INF = re.compile(rb'<(?:[\w.-]+:)?inf(?:NFe|Cte|Evento)\b[^>]*?\bversao\s*=\s*["\']([^"\']+)["\']')
+_RE_MODELO = re.compile(rb'<(?:[\w.-]+:)?mod>(\d+)<')
+_RE_TIPO_EVENTO = re.compile(rb'<(?:[\w.-]+:)?tpEvento>(\d+)<')
+
+def identificar_documento(caminho_arquivo: Union[str, Path]) -> Optional[Dict]:
+    """
+    Identifica o tipo e a versão de um documento fiscal lendo apenas o início do arquivo
+    
+    Args:
+        caminho_arquivo: Caminho para o arquivo XML
+        
+    Returns:
+        Dicionário com "tipo", "raiz" e "versao", ou None se o arquivo não puder ser lido.
+        O tipo é None quando a raiz não corresponde a nenhum documento conhecido.
+    """
+    try:
+        with open(caminho_arquivo, 'rb') as arquivo:
+            cabecalho = arquivo.read(TAMANHO_CABECALHO)
+    except Exception as e:
+        print(f"Erro ao ler o arquivo XML: {e}")
+        return None
+    
+    # Ignora comentários antes do elemento raiz
+    cabecalho_sem_comentarios = re.sub(rb'<!--.*?-->', b'', cabecalho, flags=re.S)
+    raiz = _RE_RAIZ.search(cabecalho_sem_comentarios)
+    if not raiz:
+        return {"tipo": None, "raiz": None, "versao": None}
+    
+    nome_raiz = raiz.group(1).decode('ascii', 'ignore')
+    # Documentos sem protocolo (NFe, CTe, evento) trazem a versão apenas em infNFe/infCte/infEvento
+    versao = _RE_VERSAO.search(raiz.group(2)) or _RE_VERSAO_INF.search(cabecalho)
+    tipo = None
+    
+    if nome_raiz in ("nfeProc", "NFe"):
+        # O modelo (55 = NF-e, 65 = NFC-e) está na chave de acesso ou em ide/mod
+        chave = _RE_CHAVE_NFE.search(cabecalho)
+        modelo = chave.group(1)[20:22] if chave else None
+        if modelo is None:
+            mod = _RE_MODELO.search(cabecalho)
+            modelo = mod.group(1) if mod else b"55"
+        tipo = "NFC-e" if modelo == b"65" else "NF-e"
+    elif nome_raiz in ("cteProc", "CTe"):
+        tipo = "CT-e"
+    elif nome_raiz in ("procEventoNFe", "evento"):
+        tipo_evento = _RE_TIPO_EVENTO.search(cabecalho)
+        if tipo_evento is None or tipo_evento.group(1).decode() == EVENTO_CANCELAMENTO:
+            tipo = "Cancelamento NF-e"
+        else:
+            tipo = f"Evento NF-e {tipo_evento.group(1).decode()}"
+    
+    return {
+        "tipo": tipo,
+        "raiz": nome_raiz,
+        "versao": versao.group(1).decode('ascii', 'ignore') if versao else None,
+    }
+
+# Extratores registrados por tipo de documento
+EXTRATORES: Dict[str, Callable[[Dict, PlanoExtracao], Optional[Dict]]] = {}
+
+def registrar_extrator(*tipos: str):
+    """
+    Decorador que registra uma função como extratora dos tipos de documento informados
+    
+    A função recebe o dicionário do XML e o plano de extração e retorna um
+    dicionário com "dados", "data_emissao" e "chaves_canceladas".
+    
+    Args:
+        tipos: Tipos de documento retornados por identificar_documento
+    """
+    def decorador(funcao):
+        for tipo in tipos:
+            EXTRATORES[tipo] = funcao
+        return funcao
+    return decorador
+
+@registrar_extrator("NF-e", "NFC-e")
+def _extrair_nfe(dados_xml: Dict, plano: PlanoExtracao) -> Optional[Dict]:
+    """Extrai os itens de uma NF-e/NFC-e, com ou sem protocolo de autorização"""
+    if "nfeProc" in dados_xml:
+        dados_xml = dados_xml["nfeProc"]
+    inf_nfe = dados_xml["NFe"]["infNFe"]
+    chave = inf_nfe.get("@Id", "")[3:] or None
+    
+    dados = plano.extrair(inf_nfe)
+    for linha in dados:
+        linha[COLUNA_CHAVE] = chave
+    
+    return {
+        "dados": dados,
+        "data_emissao": formatar_data(inf_nfe["ide"]["dhEmi"]),
+        "chaves_canceladas": [],
+    }
+
+@registrar_extrator("Cancelamento NF-e")
+def _extrair_cancelamento(dados_xml: Dict, plano: PlanoExtracao) -> Optional[Dict]:
+    """Extrai a chave da nota cancelada de um evento de cancelamento"""
+    if "procEventoNFe" in dados_xml:
+        dados_xml = dados_xml["procEventoNFe"]
+    inf_evento = dados_xml["evento"]["infEvento"]
+    if inf_evento.get("tpEvento") != EVENTO_CANCELAMENTO:
+        return None
+    
+    # Eventos com retorno da SEFAZ só valem se foram registrados (cStat 135, 136 ou 155)
+    ret_evento = dados_xml.get("retEvento")
+    if ret_evento and ret_evento["infEvento"].get("cStat") not in ("135", "136", "155"):
+        print(f"Evento de cancelamento não registrado para a chave {inf_evento.get('chNFe')}")
+        return None
+    
+    return {
+        "dados": [],
+        "data_emissao": None,
+        "chaves_canceladas": [inf_evento["chNFe"]],
+    }
+
+def extrair_documento(caminho_xml: Union[str, Path],
+                      plano: Optional[PlanoExtracao] = None,
+                      identificacao: Optional[Dict] = None) -> Optional[Dict]:
+    """
+    Identifica o tipo do documento e o encaminha para o extrator registrado
+    
+    Documentos sem extrator registrado são ignorados sem que o XML seja lido por completo.
     
     Args:
         caminho_xml: Caminho para o arquivo XML
+        plano: Plano de extração. Se não fornecido, usa os campos configurados.
+        identificacao: Resultado de identificar_documento, se já disponível
         
     Returns:
-        tuple: (dados, data_emissao) - Lista de dicionários com os dados e a data de emissão formatada
+        Dicionário com "tipo", "versao", "dados", "data_emissao" e "chaves_canceladas",
+        ou None se o documento não for suportado ou não puder ser lido
     """
+    if identificacao is None:
+        identificacao = identificar_documento(caminho_xml)
+    if not identificacao:
+        return None
+    
+    extrator = EXTRATORES.get(identificacao["tipo"])
+    if extrator is None:
+        descricao = identificacao["tipo"] or identificacao["raiz"] or "desconhecido"
+        print(f"Documento não suportado ({descricao}): {caminho_xml}")
+        return None
+    
     dados_xml = ler_arquivo_xml(caminho_xml)
     if not dados_xml:
-        return [], None
+        return None
     
-    dados_nfe = dados_xml["nfeProc"]["NFe"]
+    if plano is None:
+        plano = obter_plano_extracao()
     
-    # Dados comuns para todos os itens
-    nome_fornecedor = dados_nfe["infNFe"]["emit"]["xNome"]
-    numero_nota = dados_nfe["infNFe"]["ide"]["nNF"]
-    data_emissao_iso = dados_nfe["infNFe"]["ide"]["dhEmi"]
-    data_emissao = formatar_data(data_emissao_iso)
+    try:
+        resultado = extrator(dados_xml, plano)
+    except (KeyError, TypeError) as e:
+        print(f"Estrutura inesperada em {caminho_xml} ({identificacao['tipo']}): {e}")
+        return None
+    if resultado is None:
+        return None
     
-    # Pegando os itens da nota fiscal
-    itens = dados_nfe["infNFe"]["det"]
+    resultado.update(tipo=identificacao["tipo"], versao=identificacao["versao"])
+    return resultado
+
+def extrair_dados_xml(caminho_xml: Union[str, Path],
+                      plano: Optional[PlanoExtracao] = None) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Extrai os dados relevantes do XML para uma lista de dicionários
     
-    # Verificando se é apenas um item ou uma lista de itens
-    if isinstance(itens, dict):
-        itens = [itens]  # Transformando em lista para uniformizar o tratamento
+    Args:
+        caminho_xml: Caminho para o arquivo XML
+        plano: Plano de extração. Se não fornecido, usa os campos configurados.
+        
+    Returns:
+        tuple: (dados, data_emissao) - Lista de dicionários com os dados e a data de emissão formatada
+    """
+    documento = extrair_documento(caminho_xml, plano)
+    if not documento:
+        return [], None
     
-    # Lista para armazenar os dados de cada item
-    dados_planilha = []
+    return documento["dados"], documento["data_emissao"]
+
+def obter_nome_mes_chave(chave: str) -> Optional[str]:
+    """
+    Retorna o nome do mês de emissão codificado na chave de acesso (posições AAMM)
     
-    # Iterando sobre cada item
-    for item in itens:
-        descricao_produto = item["prod"]["xProd"]
-        valor_item = item["prod"]["vProd"]
+    Args:
+        chave: Chave de acesso com 44 dígitos
         
-        # Adiciona os dados do item à lista
-        dados_planilha.append({
-            "Data de Emissão": data_emissao,
-            "Nome do Fornecedor": nome_fornecedor,
-            "Número da Nota": numero_nota,
-            "Descrição do Produto": descricao_produto,
-            "Valor do Item": valor_item,
-        })
-    
-    return dados_planilha, data_emissao
+    Returns:
+        Nome do mês por extenso ou None em caso de erro
+    """
+    return obter_nome_mes(f"01/{chave[4:6]}/20{chave[2:4]}")
 
 def obter_nome_mes(data_formatada: str) -> Optional[str]:
     """